@@ -0,0 +1,206 @@
+import random
+import time
+from collections import namedtuple
+
+from blasts import SPECIALS
+from clears import resolve
+from engine import LEFT, RIGHT, ROTATE, DROP, SHAPE
+from shapes import MASKS, cells as shape_cells, fits as shape_fits, rotate as shape_rotate
+
+# How much each board feature counts when scoring a placement, positive is good
+WEIGHTS = {
+    "height": -0.5,  # sum of the column heights
+    "max_height": -1.0,  # height of the highest column
+    "holes": -4.0,  # empty cells with a block somewhere above them
+    "bumpiness": -0.4,  # sum of the height differences between neighboring columns
+    "cleared": 1.0,  # blocks cleared
+    "chain": 3.0,  # clear passes a landing set off
+    "adjacent": 0.8,  # landed blocks touching a block of the same type
+}
+
+# Placements that leave a column this close to the top are scored as losing
+DANGER_ROWS = 2
+LOSS = -1e9
+
+# depth: sets searched (the current one plus depth - 1 from the preview), beam: boards kept per depth,
+# think_ms: time the search may take per tick so it never eats a whole frame (a placement that sets off
+# a long cascade costs a lot more than one that doesn't, so this is a time and not a count),
+# move_interval: ticks between two inputs, blunder: chance to play a random placement instead of the best one
+Level = namedtuple("Level", "depth beam think_ms move_interval blunder")
+
+LEVELS = {
+    "easy": Level(1, 1, 0.5, 12, 0.25),
+    "normal": Level(2, 3, 1.0, 6, 0.05),
+    "hard": Level(3, 6, 2.0, 2, 0.0),
+}
+
+# One way to land a set: how many times it is rotated before moving sideways, the column its origin ends in,
+# and the (row, col) cells it lands on
+Placement = namedtuple("Placement", "rotations col cells")
+
+
+def placements(board, origin, rotation=0):
+    # Every (rotation, column) the set can reach from where it is by rotating first (kicked like Engine.rotate)
+    # and then moving sideways, dropped as far as it goes. A rotation that doesn't fit at all blocks the next ones
+    # Fit tests go through the rotation's row bitmasks, cells are only made for the placements found
+    found = []
+    for rotations in range(4):
+        if rotations:
+            turned = shape_rotate(board, SHAPE, origin, rotation)
+            if turned is None:
+                break
+            origin, rotation, _ = turned
+        top, left, masks = MASKS[SHAPE][rotation]
+        row = origin[0]
+        for step in (-1, 1):
+            col = origin[1] if step < 0 else origin[1] + 1
+            while board.fits_masks(row + top, col + left, masks):
+                cells = shape_cells(SHAPE, (row, col), rotation)
+                distance = board.drop_distance(cells)
+                if distance is None:
+                    distance = 0
+                    while board.fits_masks(row + top + distance + 1, col + left, masks):
+                        distance += 1
+                found.append(Placement(rotations, col, [(cell_row + distance, cell_col) for cell_row, cell_col in cells]))
+                col += step
+    return found
+
+
+def holes(board):
+    # Empty cells below the top block of their column, one AND per row on the row bitmasks from the highest block down
+    covered = count = 0
+    rows = board.rows
+    for row in range(min(board.tops), board.height):
+        count += bin(covered & ~rows[row]).count("1")
+        covered |= rows[row]
+    return count
+
+
+def evaluate(board, placement, types, weights=WEIGHTS):
+    # Land the set on a copy of the board, resolve the clears and score the result. Returns (reward for
+    # what this placement did, board after it, score of that board), the reward is None for a losing move
+    board = board.copy()
+    for (row, col), block_type in zip(placement.cells, types):
+        if row < 0:
+            return None, board, LOSS
+        board.set(row, col, block_type)
+    fuses = [cell for cell, block_type in zip(placement.cells, types) if block_type in SPECIALS]
+    steps = resolve(board, placement.cells, fuses)
+    reward = weights["chain"] * len(steps)
+    if steps:
+        reward += weights["cleared"] * sum(len(step.cleared) for step in steps)
+    else:
+        # Blocks that now touch their own type are on the way to a group, pairs inside the set count too
+        width, size, types_array = board.width, len(board.types), board.types
+        adjacent = 0
+        for row, col in placement.cells:
+            index = row * width + col
+            block_type = types_array[index]
+            if index >= width and types_array[index - width] == block_type:
+                adjacent += 1
+            if index + width < size and types_array[index + width] == block_type:
+                adjacent += 1
+            if col > 0 and types_array[index - 1] == block_type:
+                adjacent += 1
+            if col < width - 1 and types_array[index + 1] == block_type:
+                adjacent += 1
+        reward += weights["adjacent"] * adjacent
+    return reward, board, score_board(board, weights)
+
+
+def score_board(board, weights=WEIGHTS):
+    # Heights straight from the board's height map
+    tops = board.tops
+    highest = min(tops)
+    if highest < DANGER_ROWS:
+        return LOSS
+    bumpiness = 0
+    for col in range(len(tops) - 1):
+        bumpiness += abs(tops[col] - tops[col + 1])
+    return (weights["height"] * (board.height * len(tops) - sum(tops)) + weights["max_height"] * (board.height - highest) +
+            weights["holes"] * holes(board) + weights["bumpiness"] * bumpiness)
+
+
+# CPU opponent for one engine. Once per set it searches the placements of the current set and the
+# preview sets with a beam search, then steers the set there with the same actions a player sends.
+# The search is spread over ticks, each call to actions thinks for at most level.think_ms
+class AIController:
+    def __init__(self, engine, level="normal", seed=None, weights=WEIGHTS):
+        self.engine = engine
+        self.level = LEVELS[level] if isinstance(level, str) else level
+        self.weights = weights
+        self.rng = random.Random(seed)
+        self.piece = None  # engine.pieces of the set being planned or steered
+        self.search = None
+        self.target = None  # the chosen Placement
+        self.cooldown = 0
+        self.deadline = 0.0
+        self.evaluated = 0  # placements evaluated for the current set, for tuning the budget
+
+    def actions(self):
+        # The action bitmask for this tick
+        engine = self.engine
+        if engine.game_over:
+            return 0
+        if engine.pieces != self.piece:
+            self.piece = engine.pieces
+            self.search = self.plan()
+            self.target = None
+            self.evaluated = 0
+        if self.target is None:
+            self.deadline = time.perf_counter() + self.level.think_ms / 1000.0
+            self.target = next(self.search)
+            if self.target is None:
+                return 0
+        if self.cooldown:
+            self.cooldown -= 1
+            return 0
+        self.cooldown = self.level.move_interval - 1
+        return self.steer()
+
+    def steer(self):
+        # One input towards the target: rotate first, then move, then drop. The set may be a few rows
+        # lower than the search assumed, so a move that doesn't work out just drops where it is
+        engine = self.engine
+        if self.target.rotations:
+            self.target = self.target._replace(rotations=self.target.rotations - 1)
+            return ROTATE if shape_rotate(engine.board, SHAPE, engine.origin, engine.rotation) is not None else DROP
+        row, col = engine.origin
+        if col == self.target.col:
+            return DROP
+        step = 1 if self.target.col > col else -1
+        if not shape_fits(engine.board, SHAPE, (row, col + step), engine.rotation):
+            return DROP
+        return RIGHT if step > 0 else LEFT
+
+    def plan(self):
+        # Generator for the search, yields None while it is still thinking and the first Placement of the
+        # best line once it is done. It yields as soon as the tick's thinking time is used up
+        level, engine = self.level, self.engine
+        sets = [engine.types] + engine.randomizer.preview()[:level.depth - 1]
+        spawn = (0, engine.board.width // 2)
+        # Beam entries: (score, reward so far, board, first placement)
+        beam = [(0.0, 0.0, engine.board, None)]
+        for depth, types in enumerate(sets):
+            candidates = []
+            origin, rotation = (spawn, 0) if depth else (engine.origin, engine.rotation)
+            for _, reward, board, first in beam:
+                for placement in placements(board, origin, rotation):
+                    gained, after, score = evaluate(board, placement, types, self.weights)
+                    self.evaluated += 1
+                    if gained is not None and score > LOSS:
+                        candidates.append((reward + gained + score, reward + gained, after, first or placement))
+                    if time.perf_counter() > self.deadline:
+                        yield None
+            if not candidates:
+                break
+            candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+            beam = candidates[:level.beam]
+            if depth == 0 and self.rng.random() < level.blunder:
+                beam = [self.rng.choice(candidates)]
+        best = beam[0][3]
+        if best is None:
+            # Nothing is safe, drop the set where it is
+            best = Placement(0, engine.cells[1][1], engine.cells)
+        while True:
+            yield best
@@ -0,0 +1,119 @@
+import os
+import threading
+
+import pygame
+
+# Every image the game uses, by name
+MANIFEST = {
+    "wood": "wood.png",
+    "rock": "rock.png",
+    "diamond": "diamond.png",
+    "bomb": "bomb.png",
+    "missile": "missile.png",
+    "block": "block.png",
+    "block0": "block0.png",
+    "block1": "block1.png",
+    "block2": "block2.png",
+    "block3": "block3.png",
+    "block4": "block4.png",
+    "check": "check.png",
+    "grid_bg": "grid_bg.png",
+    "tiles": "images/tiles.png",
+}
+
+# Decoded and scaled pixels are kept here between runs, one raw RGBA file per image and size
+CACHE_DIR = ".asset_cache"
+
+
+# Loads images from the manifest the first time they are asked for. Decoded, scaled pixels are written
+# to CACHE_DIR so later startups read raw bytes instead of decoding PNGs again. preload can do the
+# decoding on a background thread (during the splash screen), get converts to the display's pixel
+# format on the main thread
+class Assets:
+    def __init__(self, manifest=MANIFEST, cache_dir=CACHE_DIR):
+        self.manifest = manifest
+        self.cache_dir = cache_dir
+        self.surfaces = {}  # (name, size) -> surface converted for the display
+        self.raw = {}  # (name, size) -> decoded surface waiting to be converted
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pending = set()  # (name, size) the background thread has been asked to load
+
+    def get(self, name, size=None):
+        # size is (width, height) to scale to, or None for the image's own size
+        key = (name, size)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            if key in self.pending:
+                # Don't decode the same image twice, let the background thread finish it
+                self.wait()
+            with self.lock:
+                surface = self.raw.pop(key, None)
+            if surface is None:
+                surface = self.load(name, size)
+            if pygame.display.get_surface() is not None:
+                surface = surface.convert_alpha()
+            self.surfaces[key] = surface
+        return surface
+
+    def cache_path(self, name, size):
+        # The source file's modification time is part of the name so edited images are picked up
+        path = self.manifest[name]
+        width, height = size if size is not None else (0, 0)
+        return os.path.join(self.cache_dir, "{}-{}x{}-{}.rgba".format(name, width, height, int(os.path.getmtime(path))))
+
+    def load(self, name, size):
+        # Read the decoded pixels from the disk cache, or decode the PNG and fill the cache
+        cache_path = self.cache_path(name, size)
+        try:
+            with open(cache_path, "rb") as f:
+                width, height = int.from_bytes(f.read(4), "little"), int.from_bytes(f.read(4), "little")
+                return pygame.image.frombytes(f.read(), (width, height), "RGBA")
+        except (OSError, ValueError):
+            pass
+
+        surface = pygame.image.load(self.manifest[name])
+        if size is not None:
+            surface = pygame.transform.scale(surface, size)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = cache_path + ".tmp"
+            with open(temp_path, "wb") as f:
+                f.write(surface.get_width().to_bytes(4, "little") + surface.get_height().to_bytes(4, "little"))
+                f.write(pygame.image.tobytes(surface, "RGBA"))
+            os.replace(temp_path, cache_path)
+        except OSError:
+            # A read-only install still works, just without the cache
+            pass
+        return surface
+
+    def preload(self, requests):
+        # Decode (name, size) pairs on a background thread, images that are missing are skipped
+        requests = [(name, size) for name, size in requests if (name, size) not in self.surfaces]
+        self.pending.update(requests)
+
+        def run():
+            for name, size in requests:
+                key = (name, size)
+                try:
+                    surface = self.load(name, size)
+                except (OSError, pygame.error):
+                    continue
+                with self.lock:
+                    self.raw[key] = surface
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    def wait(self):
+        # Block until a background preload is done
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+            self.pending.clear()
+
+    def clear(self):
+        self.surfaces.clear()
+
+
+assets = Assets()
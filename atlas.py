@@ -0,0 +1,86 @@
+import struct
+
+import pygame
+
+from assets import assets
+
+# Size of one tile on the sheet, in pixels
+TILE_SIZE = 32
+
+# Tile index (row-major, left to right) of the named images on images/tiles.png, the same pictures
+# as the loose block*.png, wood.png, ... files
+TILE_NAMES = {
+    "block0": 0,
+    "block4": 1,
+    "block2": 2,
+    "block": 3,
+    "rock": 4,
+    "block3": 5,
+    "bomb": 6,
+    "wood": 7,
+    "block1": 8,
+    "diamond": 9,
+}
+
+
+# A sprite sheet loaded once as a single surface. Tiles are handed out as subsurfaces, so every block
+# blitted from the atlas reads from the same pixels instead of one small surface per image. The sheet is
+# scaled as a whole for each tile size the game asks for
+class Atlas:
+    def __init__(self, sheet="tiles", tile_size=TILE_SIZE, names=TILE_NAMES):
+        self.sheet = sheet
+        self.tile_size = tile_size
+        self.names = names
+        self.sheets = {}  # tile size -> scaled sheet surface
+        self.tiles = {}  # (name or index, tile size) -> subsurface
+
+    def __contains__(self, key):
+        return key in self.names
+
+    def index(self, key):
+        # Tiles can be asked for by name or by index
+        return self.names[key] if isinstance(key, str) else key
+
+    def sheet_size(self, size):
+        # Size of the whole sheet scaled so one tile is size pixels, read from the PNG header so it
+        # doesn't need the image decoded
+        with open(assets.manifest[self.sheet], "rb") as f:
+            width, height = struct.unpack(">II", f.read(24)[16:])
+        scale = size / self.tile_size
+        return round(width * scale), round(height * scale)
+
+    def surface(self, size=None):
+        # The sheet scaled for tiles of size pixels
+        size = size or self.tile_size
+        sheet = self.sheets.get(size)
+        if sheet is None:
+            sheet = assets.get(self.sheet, self.sheet_size(size))
+            self.sheets[size] = sheet
+        return sheet
+
+    def requests(self, size):
+        # What assets.preload has to load for tiles of size pixels
+        return [(self.sheet, self.sheet_size(size))]
+
+    def rect(self, key, size=None):
+        # Area of a tile on the sheet scaled for size, the bottom row of tiles.png is cut short by a pixel
+        size = size or self.tile_size
+        sheet = self.surface(size)
+        columns = sheet.get_width() // size
+        row, col = divmod(self.index(key), columns)
+        return pygame.Rect(col * size, row * size, size, size).clip(sheet.get_rect())
+
+    def get(self, key, size=None):
+        size = size or self.tile_size
+        tile = self.tiles.get((key, size))
+        if tile is None:
+            tile = self.surface(size).subsurface(self.rect(key, size))
+            self.tiles[(key, size)] = tile
+        return tile
+
+    def clear(self):
+        self.sheets.clear()
+        self.tiles.clear()
+
+
+tiles = Atlas()
@@ -0,0 +1,218 @@
+# Monte-Carlo balancing runner: plays many headless games with different bag configurations and
+# scripted policies across a process pool and writes the aggregated stats to a CSV or JSON report
+#
+#   python balance.py --games 10000 --bag even=20,20,20,20,20 --bag few-bombs=30,30,30,5,5 --policy drop --policy flat --out report.csv
+#
+# With the even bag the scripted policies clear blocks as fast as they come and practically never lose, so
+# those games all run to --max-ticks and the peak stack height is what tells the bags apart
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+from collections import Counter
+
+from engine import Engine, BLOCK_TYPES, BLOCK_NAMES, LEFT, RIGHT, ROTATE, DROP
+
+# Reported when a game hits the tick limit without ending
+MAX_TICKS = "max_ticks"
+
+# Default tick limit, at gravity 1 the drop policy places about 730 sets in that many ticks
+DEFAULT_MAX_TICKS = 2000
+
+# Number of games each worker plays per job, large enough to hide the pool overhead
+CHUNK_SIZE = 500
+
+RANDOM_ACTIONS = (0, 0, 0, LEFT, RIGHT, ROTATE, DROP)
+
+
+# Scripted policies, each returns the action bitmask for the next tick. plan is a dict the policy
+# can use to remember things about the current set
+def idle_policy(engine, rng, plan):
+    return 0
+
+
+def random_policy(engine, rng, plan):
+    return rng.choice(RANDOM_ACTIONS)
+
+
+def drop_policy(engine, rng, plan):
+    # Steer every set to a random column, then drop it
+    if plan.get("piece") != engine.pieces:
+        plan["piece"] = engine.pieces
+        plan["target"] = rng.randrange(1, engine.board.width)
+    return steer(engine, plan["target"])
+
+
+def flat_policy(engine, rng, plan):
+    # Steer every set to the lowest column, then drop it
+    if plan.get("piece") != engine.pieces:
+        plan["piece"] = engine.pieces
+        plan["target"] = lowest_column(engine.board)
+    return steer(engine, plan["target"])
+
+
+def steer(engine, target):
+    col = engine.cells[1][1]
+    if col < target:
+        return RIGHT
+    if col > target:
+        return LEFT
+    return DROP
+
+
+def lowest_column(board):
+    # The pivot column of the L is its right column, so column 0 is never a target
+    best_col, best_height = 1, board.height + 1
+    for col in range(1, board.width):
+        bit = 1 << col
+        height = 0
+        for row in range(board.height):
+            if board.rows[row] & bit:
+                height = board.height - row
+                break
+        if height < best_height:
+            best_col, best_height = col, height
+    return best_col
+
+
+POLICIES = {
+    "idle": idle_policy,
+    "random": random_policy,
+    "drop": drop_policy,
+    "flat": flat_policy,
+}
+
+
+def play(bag, policy, seed, max_ticks, gravity):
+    # Play one game and return (ticks, pieces, blocks cleared, highest stack in rows, spawned type counts,
+    # game-over cause)
+    engine = Engine(seed=seed, gravity=gravity, bag=bag)
+    board = engine.board
+    rng = random.Random(seed)
+    plan = {}
+    counts = Counter(engine.types)
+    pieces = engine.pieces
+    peak = 0
+    while not engine.game_over and engine.ticks < max_ticks:
+        engine.step(policy(engine, rng, plan))
+        if engine.landed:
+            peak = max(peak, board.height - min(board.tops))
+        if engine.pieces != pieces:
+            pieces = engine.pieces
+            counts.update(engine.types)
+    return engine.ticks, engine.pieces, engine.cleared_total, peak, counts, engine.cause or MAX_TICKS
+
+
+def run_chunk(job):
+    # Worker entry point, plays a range of seeds for one (bag, policy) pair
+    label, bag, policy_name, first_seed, games, max_ticks, gravity = job
+    policy = POLICIES[policy_name]
+    ticks, pieces, cleared, peaks, counts, causes = [], [], [], [], Counter(), Counter()
+    for seed in range(first_seed, first_seed + games):
+        game_ticks, game_pieces, game_cleared, game_peak, game_counts, cause = play(bag, policy, seed, max_ticks, gravity)
+        ticks.append(game_ticks)
+        pieces.append(game_pieces)
+        cleared.append(game_cleared)
+        peaks.append(game_peak)
+        counts.update(game_counts)
+        causes[cause] += 1
+    return label, policy_name, ticks, pieces, cleared, peaks, counts, causes
+
+
+def parse_bag(spec):
+    # "label=n1,n2,n3,n4,n5" with the number of blocks of each type in the bag
+    label, _, counts = spec.partition("=")
+    counts = [int(count) for count in counts.split(",")]
+    if len(counts) != len(BLOCK_TYPES):
+        raise argparse.ArgumentTypeError("expected {} counts in {!r}".format(len(BLOCK_TYPES), spec))
+    return label, counts
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(label, policy_name, ticks, pieces, cleared, peaks, counts, causes):
+    ticks.sort()
+    peaks.sort()
+    total = sum(counts.values()) or 1
+    row = {
+        "bag": label,
+        "policy": policy_name,
+        "games": len(ticks),
+        "mean_ticks": round(statistics.fmean(ticks), 2),
+        "p50_ticks": percentile(ticks, 0.5),
+        "p90_ticks": percentile(ticks, 0.9),
+        "mean_pieces": round(statistics.fmean(pieces), 2),
+        "mean_cleared": round(statistics.fmean(cleared), 2),
+        "mean_peak_height": round(statistics.fmean(peaks), 2),
+        "p90_peak_height": percentile(peaks, 0.9),
+    }
+    for block_type in BLOCK_TYPES:
+        row["freq_" + BLOCK_NAMES[block_type]] = round(counts[block_type] / total, 4)
+    for cause in ("block_out", "lock_out", MAX_TICKS):
+        row["cause_" + cause] = causes[cause]
+    return row
+
+
+def run(bags, policies, games, max_ticks, gravity, workers):
+    jobs = []
+    for label, bag in bags:
+        for policy_name in policies:
+            for first_seed in range(0, games, CHUNK_SIZE):
+                jobs.append((label, bag, policy_name, first_seed, min(CHUNK_SIZE, games - first_seed), max_ticks, gravity))
+
+    results = {}
+    with multiprocessing.Pool(workers) as pool:
+        for label, policy_name, ticks, pieces, cleared, peaks, counts, causes in pool.imap_unordered(run_chunk, jobs):
+            merged = results.setdefault((label, policy_name), ([], [], [], [], Counter(), Counter()))
+            merged[0].extend(ticks)
+            merged[1].extend(pieces)
+            merged[2].extend(cleared)
+            merged[3].extend(peaks)
+            merged[4].update(counts)
+            merged[5].update(causes)
+
+    # Keep the report in the order the bags and policies were given
+    return [summarize(label, policy_name, *results[(label, policy_name)]) for label, _ in bags for policy_name in policies]
+
+
+def write_report(rows, out):
+    if out.endswith(".json"):
+        with open(out, "w") as f:
+            json.dump(rows, f, indent=2)
+        return
+    with open(out, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play headless games in parallel to balance the block bag")
+    parser.add_argument("--games", type=int, default=1000, help="games per bag and policy")
+    parser.add_argument("--bag", type=parse_bag, action="append",
+                        help="label=n1,n2,n3,n4,n5 with the number of blocks of each type ({}) in the bag, may be repeated"
+                        .format(", ".join(BLOCK_NAMES[block_type] for block_type in BLOCK_TYPES)))
+    parser.add_argument("--policy", choices=sorted(POLICIES), action="append", help="may be repeated, default drop")
+    parser.add_argument("--max-ticks", type=int, default=DEFAULT_MAX_TICKS, help="stop a game after this many ticks")
+    parser.add_argument("--gravity", type=int, default=1, help="ticks per row")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes in the pool")
+    parser.add_argument("--out", default="balance.csv", help="report path, .json writes JSON, anything else CSV")
+    args = parser.parse_args(argv)
+
+    bags = args.bag or [("even", None)]
+    policies = args.policy or ["drop"]
+    rows = run(bags, policies, args.games, args.max_ticks, args.gravity, args.workers)
+    write_report(rows, args.out)
+    for row in rows:
+        print("{bag:>12} {policy:>8} games={games} mean_ticks={mean_ticks} mean_pieces={mean_pieces} "
+              "mean_peak_height={mean_peak_height} max_ticks={cause_max_ticks}".format(**row))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+# Headless benchmarks for the board and render hot paths, compared against stored baselines
+#
+#   python bench.py --save                  measure and store the baselines for this machine
+#   python bench.py                         measure and fail if anything got slower than the threshold
+#   python bench.py --only draw_full --threshold 1.1
+#
+# Runs with SDL_VIDEODRIVER=dummy unless another video driver is set. Besides the baselines, the frame
+# check fails when two full boards take longer to update and repaint than one frame at FRAME_CAP
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+import game
+import gamewip
+from ai import evaluate, placements
+from balance import drop_policy
+from engine import Engine, BLOCK_TYPES
+from textures import textures
+
+# Where the baselines are stored (per machine, not checked in), and how much slower than its baseline a benchmark may get
+BASELINE_PATH, THRESHOLD = "bench_baseline.json", 1.25
+
+# Each benchmark is timed in REPEATS batches lasting about MIN_TIME seconds in total, the fastest batch counts
+REPEATS, MIN_TIME = 7, 1.0
+
+# Ticks per run of the engine_ticks benchmark, 10 seconds of play
+TICK_BATCH = 600
+
+# Block types used to fill boards, the specials would go off
+FILL_TYPES = [block_type for block_type in BLOCK_TYPES if block_type < 4]
+
+
+def fill(board, rows):
+    # Fill the bottom rows with blocks in a pattern that has no groups to clear
+    for row in range(board.height - rows, board.height):
+        for col in range(board.width):
+            board.set(row, col, FILL_TYPES[(row + col * 2) % len(FILL_TYPES)])
+
+
+def new_player(rows):
+    player = gamewip.Player(0, 0, gamewip.BLOCK_SIZE, (gamewip.GRID_WIDTH * gamewip.BLOCK_SIZE,
+                                                      gamewip.GRID_HEIGHT * gamewip.BLOCK_SIZE), seed=1)
+    fill(player.grid, rows)
+    player.rebuild_layer()
+    player.sync_blocks()
+    return player
+
+
+def bench_draw(rows):
+    # Full repaint of one board, the worst case of a frame
+    def setup(screen):
+        player = new_player(rows)
+
+        def run():
+            player.invalidate()
+            player.draw(screen)
+        return run
+    return setup
+
+
+def bench_frame(screen):
+    # One frame of two full boards: a tick each and a full repaint, what FRAME_CAP has to fit
+    players = []
+    for index in range(2):
+        player = new_player(10)
+        player.x = index * (player.grid_size[0] + 20)
+        player.build_layers()
+        players.append(player)
+    states = [player.engine.snapshot() for player in players]
+
+    def run():
+        for player, state in zip(players, states):
+            if player.engine.game_over:
+                player.engine.restore(state)
+            player.update()
+            player.invalidate()
+            player.draw(screen)
+    return run
+
+
+def bench_match(count):
+    # One frame of a match with count half full boards laid out on the screen: a batched tick and one
+    # repaint of every board, to see how the frame grows with the number of players
+    def setup(screen):
+        match = gamewip.Match(count, screen.get_size(), 1)
+        for player in match.players:
+            fill(player.grid, 6)
+            player.rebuild_layer()
+            player.sync_blocks()
+        states = [player.engine.snapshot() for player in match.players]
+        actions = [0] * count
+
+        def run():
+            for player, state in zip(match.players, states):
+                if player.engine.game_over:
+                    player.engine.restore(state)
+            match.update(actions)
+            match.invalidate()
+            match.draw(screen)
+        return run
+    return setup
+
+
+def bench_check_collision(screen):
+    player = new_player(6)
+    return player.check_collision
+
+
+def bench_drop(screen):
+    # Drop onto a half full board, the engine is restored before every drop
+    engine = Engine(seed=1)
+    fill(engine.board, 6)
+    state = engine.snapshot()
+
+    def run():
+        engine.restore(state)
+        engine.drop()
+    return run
+
+
+def legacy_player(rows):
+    player = game.Player(0, 0, game.BLOCK_SIZE, (game.GRID_WIDTH * game.BLOCK_SIZE, game.GRID_HEIGHT * game.BLOCK_SIZE))
+    fill(player.grid, rows)
+    # FallingSet starts at pixel x 1 (it is given NUM_BLOCKS as the grid width), move it into the middle of the grid
+    for block in player.current_set.blocks:
+        block.x += 4 * game.BLOCK_SIZE
+        block.y += 2 * game.BLOCK_SIZE
+    return player
+
+
+def bench_set_collides(screen):
+    return legacy_player(6).set_collides
+
+
+def bench_move_down(screen):
+    # The legacy FallingSet moving down one row, put back up after every move
+    falling = legacy_player(6).current_set
+    start = [(block, block.y) for block in falling.blocks]
+
+    def run():
+        falling.move_down()
+        for block, y in start:
+            block.y = y
+    return run
+
+
+def bench_rotate(screen):
+    return legacy_player(6).current_set.rotate
+
+
+def bench_ai_placements(screen):
+    # The AI scoring every placement of one set on a half full board
+    engine = Engine(seed=1)
+    fill(engine.board, 6)
+
+    def run():
+        for placement in placements(engine.board, engine.origin, engine.rotation):
+            evaluate(engine.board, placement, engine.types)
+    return run
+
+
+def bench_engine_ticks(screen):
+    # TICK_BATCH headless ticks of two engines played by the drop policy, the same games every run
+    def run():
+        rng = random.Random(1)
+        engines = [Engine(seed=seed) for seed in (1, 2)]
+        plans = [{}, {}]
+        for _ in range(TICK_BATCH):
+            for engine, plan in zip(engines, plans):
+                engine.step(drop_policy(engine, rng, plan))
+    return run
+
+
+BENCHMARKS = {
+    "draw_empty": bench_draw(0),
+    "draw_half": bench_draw(6),
+    "draw_full": bench_draw(12),
+    "frame_two_boards": bench_frame,
+    "match_2_boards": bench_match(2),
+    "match_4_boards": bench_match(4),
+    "match_8_boards": bench_match(8),
+    "check_collision": bench_check_collision,
+    "set_collides": bench_set_collides,
+    "drop": bench_drop,
+    "move_down": bench_move_down,
+    "rotate": bench_rotate,
+    "ai_placements": bench_ai_placements,
+    "engine_600_ticks": bench_engine_ticks,
+}
+
+
+def measure(run, repeats=REPEATS, min_time=MIN_TIME):
+    # Microseconds per call, from the fastest of the batches. The garbage collector is off like in timeit
+    gc.disable()
+    try:
+        return measure_batches(run, repeats, min_time)
+    finally:
+        gc.enable()
+
+
+def measure_batches(run, repeats, min_time):
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / repeats:
+            break
+        number *= 2
+    best = elapsed
+    for _ in range(repeats - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        best = min(best, time.perf_counter() - start)
+    return best / number * 1e6
+
+
+def load_baselines(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the board and render hot paths")
+    parser.add_argument("--only", action="append", choices=sorted(BENCHMARKS), help="run only this benchmark, may be repeated")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline file")
+    parser.add_argument("--save", action="store_true", help="store the results as the new baselines")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="slowest allowed ratio to the baseline")
+    args = parser.parse_args(argv)
+
+    pygame.init()
+    screen = pygame.display.set_mode((1024, 800))
+    textures.preload(gamewip.BLOCK_SIZE)
+
+    baselines = load_baselines(args.baseline)
+    results = {}
+    failed = []
+    for name in args.only or BENCHMARKS:
+        results[name] = microseconds = measure(BENCHMARKS[name](screen))
+        baseline = baselines.get(name)
+        line = "{:>18} {:10.2f} us".format(name, microseconds)
+        if baseline:
+            ratio = microseconds / baseline
+            line += "  {:5.2f}x baseline".format(ratio)
+            if ratio > args.threshold and not args.save:
+                line += "  REGRESSION"
+                failed.append(name)
+        print(line)
+
+    if "frame_two_boards" in results:
+        budget = 1e6 / gamewip.FRAME_CAP
+        frame = results["frame_two_boards"]
+        print("two full boards take {:.0f}% of the {:.0f} us frame budget".format(frame / budget * 100, budget))
+        if frame > budget:
+            failed.append("frame budget")
+
+    if args.save:
+        baselines.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print("baselines saved to", args.baseline)
+    pygame.quit()
+    if failed:
+        print("slower than allowed:", ", ".join(failed))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
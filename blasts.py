@@ -0,0 +1,95 @@
+from collections import namedtuple
+
+from board import ROW_BITS
+
+# Special block types, they don't match with each other but go off instead
+BOMB, MISSILE = 4, 5
+SPECIALS = (BOMB, MISSILE)
+
+# A bomb clears every cell within this many rows and columns, a missile clears its whole row and column
+BOMB_RADIUS = 1
+
+# One detonation for the renderer to animate: the special's type and cell, and the blocks it destroyed
+Blast = namedtuple("Blast", "kind row col cells")
+
+# Translation table marking special blocks with '1', used to find them all in one pass over the type array
+SPECIAL_BITS = bytes(ord("1") if block_type in SPECIALS else ord("0") for block_type in range(256))
+
+# Blast masks per board size, see blast_masks
+MASKS = {}
+
+
+# The whole board as one int, cell (row, col) is bit row * width + col. For every cell and special type
+# this returns the mask of the cells a detonation there clears, computed once per board size
+def blast_masks(width, height):
+    masks = MASKS.get((width, height))
+    if masks is not None:
+        return masks
+    full_row = (1 << width) - 1
+    column = sum(1 << (row * width) for row in range(height))
+    bombs, missiles = [], []
+    for row in range(height):
+        for col in range(width):
+            left, right = max(col - BOMB_RADIUS, 0), min(col + BOMB_RADIUS, width - 1)
+            span = (full_row >> (width - (right - left + 1))) << left
+            bomb = 0
+            for blast_row in range(max(row - BOMB_RADIUS, 0), min(row + BOMB_RADIUS, height - 1) + 1):
+                bomb |= span << (blast_row * width)
+            bombs.append(bomb)
+            missiles.append((full_row << (row * width)) | (column << col))
+    masks = MASKS[(width, height)] = {BOMB: bombs, MISSILE: missiles}
+    return masks
+
+
+def board_mask(board, table=ROW_BITS):
+    # The type array as one int, with a bit set for every cell the translation table marks
+    return int(board.types.translate(table)[::-1], 2)
+
+
+def bit_indexes(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+# Set off the specials at the given (row, col) cells and every special caught in their blasts.
+# The blast areas are ORed together from the precomputed masks and cleared from the board in one
+# pass at the end. Returns the detonations as a list of Blast
+def detonate(board, cells):
+    width = board.width
+    masks = blast_masks(width, board.height)
+    remaining = board_mask(board)
+    specials = board_mask(board, SPECIAL_BITS)
+    pending = [row * width + col for row, col in cells]
+    lit = 0
+    for index in pending:
+        lit |= 1 << index
+    blasts = []
+    while pending:
+        index = pending.pop()
+        kind = board.types[index]
+        mask = masks[kind][index]
+        hit = mask & remaining
+        remaining &= ~mask
+        # Specials caught in the blast go off too
+        chained = hit & specials & ~lit
+        lit |= chained
+        pending.extend(bit_indexes(chained))
+        blasts.append(Blast(kind, index // width, index % width, [divmod(cell, width) for cell in bit_indexes(hit)]))
+
+    for blast in blasts:
+        for row, col in blast.cells:
+            board.set(row, col, 0)
+    return blasts
+
+
+# Specials next to any of the given cells, a clear next to a special sets it off
+def adjacent_specials(board, cells):
+    width, height = board.width, board.height
+    found = set()
+    for row, col in cells:
+        for near_row, near_col in ((row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)):
+            if 0 <= near_row < height and 0 <= near_col < width and board.get(near_row, near_col) in SPECIALS:
+                found.add((near_row, near_col))
+    return sorted(found)
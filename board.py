@@ -0,0 +1,129 @@
+# Translation table turning a row of the type array into a string of '0' and '1' occupancy digits
+ROW_BITS = bytes([ord("0")] + [ord("1")] * 255)
+
+
+# Occupancy bitboard for a player's grid: one int bitmask per row (bit n set when column n is taken)
+# plus a compact type array holding the block type of every cell (0 for empty), and a height map
+# with the row of the highest block in each column
+class Board:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.full_row = (1 << width) - 1
+        self.rows = [0] * height
+        self.types = bytearray(width * height)
+        # Row of the highest block in each column, height for an empty column
+        self.tops = [height] * width
+
+    def get(self, row, col):
+        return self.types[row * self.width + col]
+
+    def set(self, row, col, block_type):
+        self.types[row * self.width + col] = block_type
+        if block_type:
+            self.rows[row] |= 1 << col
+            if row < self.tops[col]:
+                self.tops[col] = row
+        else:
+            self.rows[row] &= ~(1 << col)
+            if row == self.tops[col]:
+                # The top block went away, look further down for the new one
+                rows, top = self.rows, row + 1
+                while top < self.height and not (rows[top] >> col) & 1:
+                    top += 1
+                self.tops[col] = top
+
+    def fits(self, cells):
+        # Check if every (row, col) cell is inside the walls and free
+        rows = self.rows
+        for row, col in cells:
+            if col < 0 or col >= self.width or row >= self.height:
+                return False
+            if row >= 0 and (rows[row] >> col) & 1:
+                return False
+        return True
+
+    def fits_masks(self, row, col, masks):
+        # Check a piece given as row bitmasks (top row first, leftmost column at bit 0) placed with its
+        # top-left corner at (row, col), every row costs one shift and one AND
+        if col < 0:
+            return False
+        rows = self.rows
+        for mask in masks:
+            shifted = mask << col
+            if shifted & ~self.full_row or row >= self.height:
+                return False
+            if row >= 0 and rows[row] & shifted:
+                return False
+            row += 1
+        return True
+
+    def collapse(self):
+        # Let every block fall to the bottom of its column. Each column is compacted as a whole by taking
+        # it out of the type array as a slice and removing the empty cells, then the row masks are rebuilt
+        # from the type array. Returns the moves as (col, from_row, to_row), bottom-most block first
+        width, height, types = self.width, self.height, self.types
+        moves = []
+        for col in range(width):
+            column = types[col::width]
+            packed = column.replace(b"\0", b"")
+            compact = bytes(height - len(packed)) + packed
+            if column == compact:
+                continue
+            types[col::width] = compact
+            self.tops[col] = height - len(packed)
+            to_row = height - 1
+            for from_row in range(height - 1, -1, -1):
+                if column[from_row]:
+                    if from_row != to_row:
+                        moves.append((col, from_row, to_row))
+                    to_row -= 1
+        if moves:
+            self.rows = [int(types[start:start + width].translate(ROW_BITS)[::-1], 2) for start in range(0, width * height, width)]
+        return moves
+
+    def drop_distance(self, cells):
+        # How many rows a piece can fall, straight from the height map so it costs O(piece width).
+        # Returns None when part of the piece is below the top of its column (tucked under an
+        # overhang), the caller has to step it down instead
+        lowest = {}
+        for row, col in cells:
+            if row > lowest.get(col, -self.height):
+                lowest[col] = row
+        distance = self.height
+        for col, row in lowest.items():
+            top = self.tops[col]
+            if row >= top:
+                return None
+            if top - row - 1 < distance:
+                distance = top - row - 1
+        return distance
+
+    def copy(self):
+        # An independent board with the same contents, cheap enough for a search to make thousands
+        board = Board.__new__(Board)
+        board.width, board.height, board.full_row = self.width, self.height, self.full_row
+        board.rows = self.rows[:]
+        board.types = self.types[:]
+        board.tops = self.tops[:]
+        return board
+
+    def snapshot(self):
+        # Copy of the board state for restore, a few small copies so it can be taken every tick
+        return bytes(self.types), self.rows[:], self.tops[:]
+
+    def restore(self, state):
+        types, rows, tops = state
+        self.types = bytearray(types)
+        self.rows = rows[:]
+        self.tops = tops[:]
+
+
+# Convert a list of (row, col) cells to (top row, left column, row bitmasks) for Board.fits_masks
+def cells_to_masks(cells):
+    top = min(row for row, _ in cells)
+    left = min(col for _, col in cells)
+    masks = [0] * (max(row for row, _ in cells) - top + 1)
+    for row, col in cells:
+        masks[row - top] |= 1 << (col - left)
+    return top, left, tuple(masks)
@@ -0,0 +1,100 @@
+# Fixed-size logical canvas for the game to draw on, scaled onto the physical display when a frame is
+# presented. Layout, block sizes and the pre-scaled textures only depend on the canvas size, so drawing a
+# frame costs the same on a 1080p and a 4K monitor. Scaling by a whole factor of 1 or more is done here,
+# only for the rects that changed, every canvas pixel becomes a block of display pixels so that is exact
+# and cheap. Any other scale is left to SDL's renderer (pygame's SCALED mode): the window is opened at the
+# canvas size and the GPU scales all of it every frame, filtered or not, so no frame pays for a software
+# scale of the whole canvas
+import os
+
+import pygame
+
+# Logical resolution everything is laid out for, scales by exactly 2 to 4K
+CANVAS_SIZE = (1920, 1080)
+
+# "integer" scales by the biggest whole factor that fits, so pixels stay sharp and the rest of the display
+# is a border. "smooth" fills as much of the display as the aspect ratio allows, filtered. A display
+# smaller than the canvas can't be scaled by a whole factor, integer then shrinks it without filtering
+SCALING_MODES = ("integer", "smooth")
+
+# SDL's render scale quality hint for the modes the renderer scales
+RENDER_SCALE_QUALITY = {"integer": "nearest", "smooth": "linear"}
+
+BORDER_COLOR = (0, 0, 0)
+
+
+class ScaledDisplay:
+    def __init__(self, display_size, set_mode, size=CANVAS_SIZE, scaling="integer"):
+        # display_size is the size of the monitor, set_mode(size, flags) opens the fullscreen window
+        self.display_size = display_size
+        self.set_mode = set_mode
+        self.display = None
+        self.canvas = pygame.Surface(size)
+        self.set_scaling(scaling)
+        # Same pixel format as the display so blits and scales don't need converting
+        self.canvas = self.canvas.convert()
+
+    def set_scaling(self, scaling):
+        if scaling not in SCALING_MODES:
+            raise ValueError("unknown scaling mode: {}".format(scaling))
+        self.scaling = scaling
+        display_width, display_height = self.display_size
+        canvas_width, canvas_height = self.canvas.get_size()
+        scale = min(display_width / canvas_width, display_height / canvas_height)
+        if scaling == "integer" and scale >= 1:
+            self.scale = int(scale)
+            self.open(self.display_size, pygame.FULLSCREEN)
+        else:
+            # The renderer reads the hint when it makes the window texture, that is in set_mode
+            os.environ["SDL_RENDER_SCALE_QUALITY"] = RENDER_SCALE_QUALITY[scaling]
+            self.scale = 1
+            self.open(self.canvas.get_size(), pygame.FULLSCREEN | pygame.SCALED)
+        display_width, display_height = self.display.get_size()
+        width, height = canvas_width * self.scale, canvas_height * self.scale
+        # Where the canvas ends up on the display, centered
+        self.target = pygame.Rect((display_width - width) // 2, (display_height - height) // 2, width, height)
+        self.target_surface = self.display.subsurface(self.target)
+        self.display.fill(BORDER_COLOR)
+        self.full = True
+
+    def open(self, size, flags):
+        # pygame can't swap the renderer of an open window, so switching modes opens a new one
+        if self.display is not None:
+            caption = pygame.display.get_caption()
+            pygame.display.quit()
+            pygame.display.init()
+            pygame.display.set_caption(*caption)
+        self.display = self.set_mode(size, flags)
+
+    def toggle_scaling(self):
+        self.set_scaling(SCALING_MODES[(SCALING_MODES.index(self.scaling) + 1) % len(SCALING_MODES)])
+
+    def display_rect(self, rect):
+        # The pixels of the target a canvas rect covers
+        scale = self.scale
+        return pygame.Rect(rect.left * scale, rect.top * scale, rect.width * scale, rect.height * scale)
+
+    def present(self, rects=None):
+        # Scale the changed canvas rects (None for all of it) onto the display and show them
+        if rects is None or self.full:
+            self.full = False
+            self.scale_rect(self.canvas.get_rect())
+            pygame.display.flip()
+            return
+        bounds = self.canvas.get_rect()
+        updated = []
+        for rect in rects:
+            rect = bounds.clip(rect)
+            if rect.width and rect.height:
+                updated.append(self.scale_rect(rect))
+        if updated:
+            pygame.display.update(updated)
+
+    def scale_rect(self, rect):
+        # Returns the display rect that changed
+        dest = self.display_rect(rect)
+        if self.scale == 1:
+            self.target_surface.blit(self.canvas, dest, rect)
+        else:
+            pygame.transform.scale(self.canvas.subsurface(rect), dest.size, self.target_surface.subsurface(dest))
+        return dest.move(self.target.topleft)
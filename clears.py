@@ -0,0 +1,74 @@
+from collections import namedtuple
+
+from blasts import SPECIALS, detonate, adjacent_specials
+
+# Smallest group of connected same-type blocks that gets cleared
+CLEAR_THRESHOLD = 4
+
+# One pass of a cascade: its chain number, the (row, col) cells cleared, the blasts.Blast detonations
+# and the (col, from_row, to_row) moves of the blocks that fell into the gaps, in the order a renderer
+# should animate them
+CascadeStep = namedtuple("CascadeStep", "chain cleared blasts moves")
+
+
+# Find the groups of connected same-type blocks that touch the given cells. Only the cells reachable
+# from the seeds are visited, so the cost depends on the size of the groups, not of the board. Bombs
+# and missiles never match. Returns a list of groups (lists of board.types indexes) with at least threshold blocks
+def find_groups(board, seeds, threshold=CLEAR_THRESHOLD):
+    width, types = board.width, board.types
+    size = len(types)
+    seen = set()
+    groups = []
+    for row, col in seeds:
+        start = row * width + col
+        block_type = types[start]
+        if start in seen or not block_type or block_type in SPECIALS:
+            continue
+        seen.add(start)
+        group = [start]
+        stack = [start]
+        while stack:
+            index = stack.pop()
+            col = index % width
+            for neighbor in (index - width, index + width, index - 1 if col > 0 else -1, index + 1 if col < width - 1 else -1):
+                if 0 <= neighbor < size and neighbor not in seen and types[neighbor] == block_type:
+                    seen.add(neighbor)
+                    group.append(neighbor)
+                    stack.append(neighbor)
+        if len(group) >= threshold:
+            groups.append(group)
+    return groups
+
+
+# Empty every cell of the groups, returns the cleared (row, col) cells
+def clear_groups(board, groups):
+    width = board.width
+    cleared = []
+    for group in groups:
+        for index in group:
+            row, col = divmod(index, width)
+            board.set(row, col, 0)
+            cleared.append((row, col))
+    return cleared
+
+
+# Set off the specials at the fuse cells, clear the groups touching the seed cells, let the columns
+# fall, and keep going from the blocks that moved until nothing else matches. A clear next to a special
+# sets it off as well. Returns the cascade as a list of CascadeStep
+def resolve(board, seeds, fuses=(), threshold=CLEAR_THRESHOLD):
+    steps = []
+    blasts = detonate(board, fuses) if fuses else []
+    groups = find_groups(board, seeds, threshold)
+    while groups or blasts:
+        cleared = clear_groups(board, groups)
+        hit = adjacent_specials(board, cleared)
+        if hit:
+            blasts += detonate(board, hit)
+        for blast in blasts:
+            cleared += blast.cells
+        moves = board.collapse()
+        steps.append(CascadeStep(len(steps) + 1, cleared, blasts, moves))
+        # Only blocks that moved can have formed new groups
+        groups = find_groups(board, [(to_row, col) for col, _, to_row in moves], threshold)
+        blasts = []
+    return steps
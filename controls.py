@@ -0,0 +1,137 @@
+import time
+
+import pygame
+
+from engine import LEFT, RIGHT, ROTATE, DROP
+
+# Not a game action, reported by InputManager when a player presses start
+START = 16
+
+# Gamepad layout: stick or d-pad to move, stick down to drop, A to rotate, Start to start
+PAD_BUTTONS = {0: ROTATE, 7: START}
+AXIS_DEADZONE = 0.5
+
+# Delayed auto-shift and auto-repeat rate, in logic ticks: a held left/right moves once when pressed,
+# then again after DAS ticks and every ARR ticks after that
+DAS, ARR = 10, 2
+
+REPEATING = (LEFT, RIGHT)
+
+
+# Turns keyboard and gamepad events into per-player action bitmasks on the simulation clock.
+# Gamepads are opened once when they are plugged in (pygame also reports the ones connected at
+# startup as plugged in) and each one gets the lowest free player slot, which it keeps until it is
+# unplugged, so unplugging one pad never moves another pad to a different player
+class InputManager:
+    def __init__(self, bindings, das=DAS, arr=ARR):
+        # bindings is one {key: action} dict per player
+        self.bindings = bindings
+        self.das = das
+        self.arr = arr
+        self.pads = []  # open joysticks, in the order they were plugged in
+        self.pad_slots = {}  # joystick instance id -> player, pads beyond the number of players have none
+        players = range(len(bindings))
+        # Held actions per player and per source ("keys" or a joystick instance id)
+        self.sources = [{} for _ in players]
+        # Actions pressed since the last tick, so a tap shorter than a tick is never lost
+        self.pressed = [0 for _ in players]
+        self.press_times = [{} for _ in players]
+        # Ticks each repeating action has been held for
+        self.charge = [dict.fromkeys(REPEATING, 0) for _ in players]
+        # Seconds between the last press and the tick that used it, per player, shown by the profiler overlay
+        self.latency = [0.0 for _ in players]
+
+    def handle_event(self, event):
+        if event.type in (pygame.KEYDOWN, pygame.KEYUP):
+            for player, bindings in enumerate(self.bindings):
+                action = bindings.get(event.key)
+                if action is not None:
+                    self.set_held(player, "keys", action, event.type == pygame.KEYDOWN)
+        elif event.type == pygame.JOYDEVICEADDED:
+            joystick = pygame.joystick.Joystick(event.device_index)
+            if joystick.get_instance_id() not in [pad.get_instance_id() for pad in self.pads]:
+                self.pads.append(joystick)
+                self.assign_pads()
+        elif event.type == pygame.JOYDEVICEREMOVED:
+            self.pads = [pad for pad in self.pads if pad.get_instance_id() != event.instance_id]
+            self.pad_slots.pop(event.instance_id, None)
+            # Whatever the pad was holding is released, for every player
+            for sources in self.sources:
+                sources.pop(event.instance_id, None)
+            self.assign_pads()
+        elif event.type in (pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP):
+            player = self.pad_player(event.instance_id)
+            action = PAD_BUTTONS.get(event.button)
+            if player is not None and action is not None:
+                self.set_held(player, event.instance_id, action, event.type == pygame.JOYBUTTONDOWN)
+        elif event.type == pygame.JOYAXISMOTION:
+            player = self.pad_player(event.instance_id)
+            if player is not None and event.axis == 0:
+                self.set_held(player, event.instance_id, LEFT, event.value < -AXIS_DEADZONE)
+                self.set_held(player, event.instance_id, RIGHT, event.value > AXIS_DEADZONE)
+            elif player is not None and event.axis == 1:
+                self.set_held(player, event.instance_id, DROP, event.value > AXIS_DEADZONE)
+        elif event.type == pygame.JOYHATMOTION:
+            player = self.pad_player(event.instance_id)
+            if player is not None:
+                hat_x, hat_y = event.value
+                self.set_held(player, event.instance_id, LEFT, hat_x < 0)
+                self.set_held(player, event.instance_id, RIGHT, hat_x > 0)
+                self.set_held(player, event.instance_id, DROP, hat_y < 0)
+
+    def assign_pads(self):
+        # Give the free player slots, lowest first, to the pads without one, oldest first
+        free = [player for player in range(len(self.bindings)) if player not in self.pad_slots.values()]
+        for pad in self.pads:
+            if not free:
+                return
+            if pad.get_instance_id() not in self.pad_slots:
+                self.pad_slots[pad.get_instance_id()] = free.pop(0)
+
+    def pad_player(self, instance_id):
+        # Player that owns a joystick, None for pads beyond the number of players
+        return self.pad_slots.get(instance_id)
+
+    def held(self, player):
+        held = 0
+        for actions in self.sources[player].values():
+            held |= actions
+        return held
+
+    def set_held(self, player, source, action, down):
+        was_held = self.held(player) & action
+        actions = self.sources[player].get(source, 0)
+        self.sources[player][source] = actions | action if down else actions & ~action
+        if down and not was_held:
+            self.pressed[player] |= action
+            self.press_times[player][action] = time.perf_counter()
+            if action in self.charge[player]:
+                self.charge[player][action] = 0
+
+    def tick(self, player):
+        # Actions for one logic tick: everything pressed since the last tick, plus auto-repeat of held moves
+        actions = self.pressed[player]
+        self.pressed[player] = 0
+        held = self.held(player)
+        for action, charge in self.charge[player].items():
+            if not held & action:
+                continue
+            if not actions & action:
+                charge += 1
+                if charge >= self.das and (charge - self.das) % self.arr == 0:
+                    actions |= action
+            self.charge[player][action] = charge
+        if actions:
+            now = time.perf_counter()
+            press_times = self.press_times[player]
+            for action in list(press_times):
+                if actions & action:
+                    self.latency[player] = now - press_times.pop(action)
+        return actions & ~START
+
+    def start_pressed(self, player):
+        # Consume a start press, used by the splash and game-over screens
+        if self.pressed[player] & START:
+            self.pressed[player] &= ~START
+            return True
+        return False
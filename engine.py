@@ -0,0 +1,164 @@
+from board import Board
+from blasts import SPECIALS
+from clears import resolve
+from randomizer import BagRandomizer
+from shapes import MASKS, cells as shape_cells, fits as shape_fits, rotate as shape_rotate
+
+# Actions a player can send to the engine, combined into one bitmask per tick
+LEFT, RIGHT, ROTATE, DROP = 1, 2, 4, 8
+
+# Block types: 1 wood, 2 rock, 3 diamond, 4 bomb, 5 missile
+BLOCK_TYPES = (1, 2, 3, 4, 5)
+BLOCK_NAMES = {1: "wood", 2: "rock", 3: "diamond", 4: "bomb", 5: "missile"}
+
+# Why a game ended: the new set had no room to spawn, or a set landed partly above the grid
+BLOCK_OUT, LOCK_OUT = "block_out", "lock_out"
+
+# Default size of the game grid
+GRID_WIDTH, GRID_HEIGHT = 8, 12
+
+# Shape of every falling set, see shapes.SHAPES
+SHAPE = "L"
+
+
+# Headless game logic for one player's board, no pygame needed. Everything is in grid cells, the
+# renderer converts to pixels. The falling set is an L of three cells (shapes.SHAPES), the second cell is its origin
+class Engine:
+    def __init__(self, width=GRID_WIDTH, height=GRID_HEIGHT, seed=None, gravity=1, bag=None, preview=1):
+        self.board = Board(width, height)
+        # bag holds how many of each entry of BLOCK_TYPES go in the bag, None splits it evenly
+        self.randomizer = BagRandomizer(BLOCK_TYPES, bag, seed, preview)
+        # Number of ticks it takes the falling set to fall one row
+        self.gravity = gravity
+        self.fall_counter = 0
+        self.ticks = 0
+        self.game_over = False
+        self.cause = None
+        self.pieces = 0
+        # The falling set as its origin cell and rotation index, the cells (row, col) that gives and the block types
+        self.origin = None
+        self.rotation = 0
+        self.cells = []
+        self.types = []
+        # Board cells written during the last step and the cascade they set off (a list of
+        # clears.CascadeStep), renderers use these to find what to repaint and what to animate
+        self.landed = []
+        self.cascade = []
+        self.cleared = []
+        # Number of clear passes the last landing set off, and the total number of blocks cleared
+        self.chain = 0
+        self.cleared_total = 0
+        self.spawn()
+
+    def spawn(self):
+        # A new set always appears at the top middle of the grid, if it doesn't fit the game is over
+        self.origin = (0, self.board.width // 2)
+        self.rotation = 0
+        self.cells = shape_cells(SHAPE, self.origin)
+        self.types = self.randomizer.next_set()
+        self.pieces += 1
+        if not shape_fits(self.board, SHAPE, self.origin):
+            self.game_over = True
+            self.cause = BLOCK_OUT
+
+    def step(self, inputs=0):
+        # Advance the game by one tick with the given action bitmask
+        self.landed = []
+        self.cascade = []
+        self.cleared = []
+        if self.game_over:
+            return
+        self.ticks += 1
+        if inputs & LEFT:
+            self.move(0, -1)
+        if inputs & RIGHT:
+            self.move(0, 1)
+        if inputs & ROTATE:
+            self.rotate()
+        if inputs & DROP:
+            self.drop()
+            return
+
+        self.fall_counter += 1
+        if self.fall_counter >= self.gravity:
+            self.fall_counter = 0
+            if not self.move(1, 0):
+                self.land()
+
+    def snapshot(self):
+        # Everything the next steps depend on, restore brings the engine back to this exact point (used
+        # by rollback netplay). The falling cells and types are replaced, never changed in place, so they are shared
+        return (self.board.snapshot(), self.randomizer.snapshot(), self.origin, self.rotation, self.cells, self.types,
+                self.fall_counter, self.ticks, self.game_over, self.cause, self.pieces, self.chain, self.cleared_total)
+
+    def restore(self, state):
+        board, randomizer, self.origin, self.rotation, self.cells, self.types, self.fall_counter, self.ticks, \
+            self.game_over, self.cause, self.pieces, self.chain, self.cleared_total = state
+        self.board.restore(board)
+        self.randomizer.restore(randomizer)
+        self.landed = []
+        self.cascade = []
+        self.cleared = []
+
+    def move(self, d_row, d_col):
+        origin = (self.origin[0] + d_row, self.origin[1] + d_col)
+        if shape_fits(self.board, SHAPE, origin, self.rotation):
+            self.origin = origin
+            self.cells = [(row + d_row, col + d_col) for row, col in self.cells]
+            return True
+        return False
+
+    def rotate(self):
+        # Rotate the set clockwise around its origin, kicked off a wall or the floor if it has to, all or nothing
+        turned = shape_rotate(self.board, SHAPE, self.origin, self.rotation)
+        if turned is None:
+            return False
+        self.origin, self.rotation, self.cells = turned
+        return True
+
+    def drop_distance(self):
+        # Rows the set can fall before it lands, from the board's height map when possible
+        distance = self.board.drop_distance(self.cells)
+        if distance is None:
+            top, left, masks = MASKS[SHAPE][self.rotation]
+            row, col = self.origin[0] + top, self.origin[1] + left
+            distance = 0
+            while self.board.fits_masks(row + distance + 1, col, masks):
+                distance += 1
+        return distance
+
+    def ghost_cells(self):
+        # Where the set would land if it was dropped now
+        distance = self.drop_distance()
+        return [(row + distance, col) for row, col in self.cells]
+
+    def drop(self):
+        # Drop the set to the bottom of the grid and land it right away
+        distance = self.drop_distance()
+        self.origin = (self.origin[0] + distance, self.origin[1])
+        self.cells = [(row + distance, col) for row, col in self.cells]
+        self.land()
+
+    def land(self):
+        # Write the set into the board and spawn the next one
+        for (row, col), block_type in zip(self.cells, self.types):
+            if row < 0:
+                # Part of the set is still above the grid
+                self.game_over = True
+                self.cause = LOCK_OUT
+                continue
+            self.board.set(row, col, block_type)
+            self.landed.append((row, col))
+        self.resolve()
+        self.fall_counter = 0
+        if not self.game_over:
+            self.spawn()
+
+    def resolve(self):
+        # Landed bombs and missiles go off, then clear the groups the landed blocks completed, let the
+        # columns fall and repeat until nothing matches
+        fuses = [(row, col) for row, col in self.landed if self.board.get(row, col) in SPECIALS]
+        self.cascade = resolve(self.board, self.landed, fuses)
+        self.chain = len(self.cascade)
+        self.cleared = [cell for step in self.cascade for cell in step.cleared]
+        self.cleared_total += len(self.cleared)
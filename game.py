@@ -1,38 +1,32 @@
-import pygame
 import random
+import sys
 
-pygame.joystick.init()
-# Get a reference to each connected joystick
-joysticks = [pygame.joystick.Joystick(i) for i in range(pygame.joystick.get_count())]
+import pygame
 
-# Enable each joystick
-for joystick in joysticks:
-    joystick.init()
+from board import Board
+from pool import Pool
+from controls import InputManager, START
+from engine import LEFT, RIGHT, ROTATE, DROP
+from randomizer import BagRandomizer
+from shapes import COUNTERCLOCKWISE, SHAPES, rotate as shape_rotate
 
 FPS = 30
 
-# Define the block types and their corresponding images
+# Longest time in milliseconds the splash screen sleeps waiting for an event
+IDLE_TIMEOUT = 500
+
+# Define the block types, a block's block_type is its number here counting from 1
 BLOCK_TYPES = ["wood", "diamond", "rock", "bomb"]
-BLOCK_IMAGES = [pygame.image.load(f"{block_type}.png") for block_type in BLOCK_TYPES]
+BLOCK_IDS = list(range(1, len(BLOCK_TYPES) + 1))
 
-# Define the size of the bag and the number of blocks in each set
+# Define the size of the bag and the number of blocks in each set (the cells of a T)
 BAG_SIZE = 100
-SET_SIZE = 3
+SET_SIZE = len(SHAPES["T"])
 NUM_BLOCKS = 3
-# Create the bag of blocks
-bag = []
-for block_type in BLOCK_TYPES:
-    count = BAG_SIZE // len(BLOCK_TYPES)
-    bag.extend([block_type] * count)
-bag = random.sample(bag, k=BAG_SIZE)
-
-# Draw a new set of blocks
-def draw_set():
-    set_blocks = random.sample(bag, k=SET_SIZE)
-    for block_type in set_blocks:
-        bag.remove(block_type)
-    set_images = [BLOCK_IMAGES[BLOCK_TYPES.index(block_type)] for block_type in set_blocks]
-    return set_images
+
+# Keyboard controls: player 1 uses the arrow keys and space bar to rotate, player 2 uses a, d, s and q to rotate
+PLAYER1_CONTROLS = {pygame.K_LEFT: LEFT, pygame.K_RIGHT: RIGHT, pygame.K_DOWN: DROP, pygame.K_SPACE: ROTATE, pygame.K_RETURN: START}
+PLAYER2_CONTROLS = {pygame.K_a: LEFT, pygame.K_d: RIGHT, pygame.K_s: DROP, pygame.K_q: ROTATE, pygame.K_e: START}
 
 # Define some colors
 BLACK, WHITE, BLUE, RED, YELLOW, GRAY = (0, 0, 0), (255, 255, 255), (0, 0, 255), (255, 0, 0), (255, 255, 0), (128, 128, 128)
@@ -40,25 +34,36 @@ BLACK, WHITE, BLUE, RED, YELLOW, GRAY = (0, 0, 0), (255, 255, 255), (0, 0, 255),
 # Define the size of the game grid and blocks
 GRID_WIDTH, GRID_HEIGHT, BLOCK_SIZE = 8, 12, 64
 
-# Load the game block images
-BLOCK_IMAGES = [pygame.image.load("block{}.png".format(i)) for i in range(4)]
+# The game block images, tiles of the sprite sheet (see atlas.TILE_NAMES)
+BLOCK_IMAGES = ["block{}".format(i) for i in range(4)]
 
 
 class Block:
+    __slots__ = ("x", "y", "block_type")
+
     def __init__(self, x, y, block_type):
+        self.reset(x, y, block_type)
+
+    def reset(self, x, y, block_type):
         self.x = x
         self.y = y
         self.block_type = block_type
 
+# Blocks that left the game are reused for the next sets, see pool.py
+BLOCKS = Pool(Block)
+
 class FallingSet:
-    def __init__(self, block_images, block_size, grid_width, player):
+    def __init__(self, block_images, block_size, grid_width, player, block_types):
+        # block_types has the type of each of the four blocks, a set drawn from the player's bag
         self.player = player
-        self.blocks = [Block(grid_width//2, 0, random.randint(1, 4)),
-                       Block(grid_width//2, -block_size, random.randint(1, 4)),
-                       Block(grid_width//2-block_size, -block_size, random.randint(1, 4)),
-                       Block(grid_width//2+block_size, -block_size, random.randint(1, 4))]
+        self.blocks = [BLOCKS.acquire(grid_width//2, 0, block_types[0]),
+                       BLOCKS.acquire(grid_width//2, -block_size, block_types[1]),
+                       BLOCKS.acquire(grid_width//2-block_size, -block_size, block_types[2]),
+                       BLOCKS.acquire(grid_width//2+block_size, -block_size, block_types[3])]
         self.block_size = block_size
-        self.rotation_point = self.blocks[1].x, self.blocks[1].y
+        # The blocks are the cells of a T (see shapes.SHAPES) turned around the second block
+        self.shape = "T"
+        self.rotation = 0
     
     def update(self):
         self.move_down()
@@ -69,100 +74,75 @@ class FallingSet:
             block.y += self.block_size
 
         # Check if the blocks would collide with any blocks on the grid
-        for block in self.blocks:
-            row = (block.y - self.player.y) // self.block_size
-            col = (block.x - self.player.x) // self.block_size
-            if not (0 <= row < GRID_HEIGHT and 0 <= col < GRID_WIDTH and self.player.grid[row][col] == 0):
-                # Move the blocks back up by one row and add them to the grid
-                for block in self.blocks:
-                    block.y -= self.block_size
-                    row = (block.y - self.player.y) // self.block_size
-                    col = (block.x - self.player.x) // self.block_size
-                    self.player.grid[row][col] = block.block_type
-                self.blocks = []
-                break
+        if not self.player.grid.fits([self.player.cell(block) for block in self.blocks]):
+            # Move the blocks back up by one row and add them to the grid
+            for block in self.blocks:
+                block.y -= self.block_size
+                row, col = self.player.cell(block)
+                if row >= 0:
+                    self.player.grid.set(row, col, block.block_type)
+            BLOCKS.release(self.blocks)
+            self.blocks = []
 
     def rotate(self):
-        # Rotate the current set of blocks around the second block in the set
-        for block in self.blocks:
-            x_diff = block.x - self.rotation_point[0]
-            y_diff = block.y - self.rotation_point[1]
-            block.x = self.rotation_point[0] + y_diff
-            block.y = self.rotation_point[1] - x_diff
-
-            # Check if the rotated block would collide with any blocks on the grid
-            row = (block.y - self.player.y) // self.block_size
-            col = (block.x - self.player.x) // self.block_size
-            if not (0 <= row < GRID_HEIGHT and 0 <= col < GRID_WIDTH and self.player.grid[row][col] == 0):
-                # Rotate the blocks back to their original position
-                for block in self.blocks:
-                    x_diff = block.x - self.rotation_point[0]
-                    y_diff = block.y - self.rotation_point[1]
-                    block.x = self.rotation_point[0] - y_diff
-                    block.y = self.rotation_point[1] + x_diff
-                break
+        # Rotate the current set of blocks counterclockwise around the second block, kicked off a wall or
+        # the floor if it has to. The new cells come from the rotation table and are tested once, all or nothing
+        if not self.blocks:
+            return
+        pivot = self.blocks[1]
+        pivot_row, pivot_col = self.player.cell(pivot)
+        turned = shape_rotate(self.player.grid, self.shape, (pivot_row, pivot_col), self.rotation, COUNTERCLOCKWISE)
+        if turned is None:
+            return
+        _, self.rotation, cells = turned
+        pivot_x, pivot_y = pivot.x, pivot.y
+        for block, (row, col) in zip(self.blocks, cells):
+            block.x = pivot_x + (col - pivot_col) * self.block_size
+            block.y = pivot_y + (row - pivot_row) * self.block_size
 
 class Player:
-    def __init__(self, x, y, block_size, grid_size):
+    def __init__(self, x, y, block_size, grid_size, seed=None):
         self.x = x
         self.y = y
-        self.grid = [[0] * GRID_WIDTH for _ in range(GRID_HEIGHT)]
+        self.grid = Board(GRID_WIDTH, GRID_HEIGHT)
         self.blocks = []
         self.block_size = block_size
         self.grid_size = grid_size
-        self.current_set = FallingSet(BLOCK_IMAGES, BLOCK_SIZE, NUM_BLOCKS, self)
-        self.next_blocks = [Block(GRID_WIDTH//2, 0, random.randint(1, 4)),
-                            Block(GRID_WIDTH//2, -self.block_size, random.randint(1, 4)),
-                            Block(GRID_WIDTH//2, -2*self.block_size, random.randint(1, 4))]
+        # Every set comes from the player's own bag, players given the same seed get the same sets.
+        # next_blocks shows the first set of the bag's preview queue, the one that comes after current_set
+        self.randomizer = BagRandomizer(BLOCK_IDS, [BAG_SIZE // len(BLOCK_IDS)] * len(BLOCK_IDS), seed, set_size=SET_SIZE)
+        self.next_blocks = []
+        self.current_set = self.new_set()
         self.ready = False
 
+    def new_set(self):
+        # A falling set with the next types from the bag, next_blocks moves on to the set after it
+        falling_set = FallingSet(BLOCK_IMAGES, BLOCK_SIZE, NUM_BLOCKS, self, self.randomizer.next_set())
+        BLOCKS.release(self.next_blocks)
+        self.next_blocks = self.generate_blocks()
+        return falling_set
+
+    def generate_blocks(self):
+        # Blocks of the next set in the preview queue, stacked in the middle column
+        return [BLOCKS.acquire(GRID_WIDTH//2, -index*self.block_size, block_type)
+                for index, block_type in enumerate(self.randomizer.preview()[0])]
+
     def spawn_blocks(self):
+        # The previewed set goes into play, take it off the queue
         self.blocks.extend(self.next_blocks)
-        self.next_blocks = [Block(GRID_WIDTH//2, 0, random.randint(1, 4)),
-                            Block(GRID_WIDTH//2, -self.block_size, random.randint(1, 4)),
-                            Block(GRID_WIDTH//2, -2*self.block_size, random.randint(1, 4))]
-    def handle_input(self, joystick=None):
-        # Handle keyboard input
-        keys = pygame.key.get_pressed()
-
-        # Handle player 1 input
-        if keys[pygame.K_LEFT]:
-            self.player1.move_left()
-        elif keys[pygame.K_RIGHT]:
-            self.player1.move_right()
-        elif keys[pygame.K_DOWN]:
-            self.player1.move_down()
-        elif keys[pygame.K_SPACE]:
-            self.player1.rotate()
-       
-        # Handle player 2 input
-        
-        if keys[pygame.K_a]:
-            self.player2.move_left()
-        elif keys[pygame.K_d]:
-            self.player2.move_right()
-        elif keys[pygame.K_s]:
-            self.player2.move_down()
-        elif keys[pygame.K_q]:
-            self.player2.rotate()
-     
-       
-        # Handle joystick input, if a joystick is passed as a parameter
-        if joystick is not None:
-            x_axis = joystick.get_axis(0)
-            y_axis = joystick.get_axis(1)
-            rotate_button = joystick.get_button(0)
-            if x_axis < -0.5:
-                self.move_left()
-            elif x_axis > 0.5:
-                self.move_right()
-
-            if y_axis > 0.5:
-                self.move_down()
-
-            if rotate_button:
-                self.rotate()
-         
+        self.randomizer.next_set()
+        self.next_blocks = self.generate_blocks()
+
+    def handle_input(self, actions):
+        # Apply one tick's worth of actions from the InputManager (keyboard and gamepad)
+        if actions & LEFT:
+            self.move_left()
+        elif actions & RIGHT:
+            self.move_right()
+        if actions & DROP:
+            self.current_set.move_down()
+        if actions & ROTATE:
+            self.current_set.rotate()
 
     def update(self):
         # Move the current set of blocks down the grid
@@ -173,32 +153,26 @@ class Player:
             # Add the blocks in the set to the player's grid
             self.add_set_to_grid()
 
-            # Create a new falling set of blocks
-            self.current_set = FallingSet(BLOCK_IMAGES, BLOCK_SIZE, NUM_BLOCKS, self)
+            # Create a new falling set of blocks, the landed ones live on in the grid
+            BLOCKS.release(self.current_set.blocks)
+            self.current_set = self.new_set()
 
     def set_landed(self):
         for block in self.blocks:
-            row = int((block.y - self.y) / self.block_size)
-            col = int((block.x - self.x) / self.block_size)
+            row, col = self.cell(block)
             if 0 <= row < GRID_HEIGHT and 0 <= col < GRID_WIDTH:
-                self.grid[row][col] = block.block_type
+                self.grid.set(row, col, block.block_type)
+        BLOCKS.release(self.blocks)
         self.blocks = []
 
         # Check if the blocks would collide with any blocks on the grid
-        for block in self.current_set.blocks:
-            row = int((block.y - self.y) / self.block_size)
-            col = int((block.x - self.x) / self.block_size)
-            if row >= GRID_HEIGHT or self.grid[row][col] != 0:
-                return True
-
-        return False
+        return not self.grid.fits([self.cell(block) for block in self.current_set.blocks])
 
     def add_set_to_grid(self):
         # Add the blocks in the current set to the player's grid
         for block in self.current_set.blocks:
-            row = (block.y - self.y) // self.block_size
-            col = (block.x - self.x) // self.block_size
-            self.grid[row][col] = block.block_type
+            row, col = self.cell(block)
+            self.grid.set(row, col, block.block_type)
 
     def move_left(self):
         # Move the current set of blocks to the left by one column
@@ -206,7 +180,7 @@ class Player:
             block.x -= self.block_size
 
         # If the set would collide with any blocks on the grid, move it back to its original position
-        if self.set_would_collide():
+        if self.set_collides():
             for block in self.current_set.blocks:
                 block.x += self.block_size
 
@@ -227,12 +201,11 @@ class Player:
 
     def set_collides(self):
         # Check if the set would collide with any blocks on the grid
-        for block in self.current_set.blocks:
-            row = int((block.y - self.y) / self.block_size)
-            col = int((block.x - self.x) / self.block_size)
-            if not (0 <= row < GRID_HEIGHT and 0 <= col < GRID_WIDTH) or self.grid[row][col] != 0:
-                return True
-        return False
+        return not self.grid.fits([self.cell(block) for block in self.current_set.blocks])
+
+    def cell(self, block):
+        # Convert a block's pixel position to its (row, col) on the grid
+        return (block.y - self.y) // self.block_size, (block.x - self.x) // self.block_size
 
     def set_out_of_bounds(self):
         # Check if the set is out of bounds
@@ -262,8 +235,10 @@ class Game:
 
         self.player1_grid_size = (GRID_WIDTH, GRID_HEIGHT)
         self.player2_grid_size = (GRID_WIDTH, GRID_HEIGHT)
-        self.player1 = Player(player1_x, player1_y, BLOCK_SIZE, self.player1_grid_size)
-        self.player2 = Player(player2_x, player2_y, BLOCK_SIZE, self.player2_grid_size)
+        # Both players share one seed so they get the same sequence of sets
+        self.seed = random.randrange(2 ** 32)
+        self.player1 = Player(player1_x, player1_y, BLOCK_SIZE, self.player1_grid_size, self.seed)
+        self.player2 = Player(player2_x, player2_y, BLOCK_SIZE, self.player2_grid_size, self.seed)
 
         # Set up the falling speed of the blocks
         self.fall_speed = 0.5  # seconds per block
@@ -276,6 +251,9 @@ class Game:
 
         # Set up the clock to control the game's FPS
         self.clock = pygame.time.Clock()
+
+        # Keyboard and gamepads, opened once and kept up to date as pads are plugged in and out
+        self.input = InputManager([PLAYER1_CONTROLS, PLAYER2_CONTROLS])
    
       
     def check_players_ready(self):
@@ -290,66 +268,46 @@ class Game:
 
 
     def display_splash_screen(self):
-        # Set up font and text
+        # Set up font and text, everything is rendered once up front
         font = pygame.font.Font(None, 50)
         text = font.render("Press Start to begin", True, BLACK)
         text_rect = text.get_rect(center=self.screen.get_rect().center)
 
-     
-        # Set up font and text for player 1 status
-        p1_font = pygame.font.Font(None, 30)
-        p1_text = p1_font.render("Player 1 - Ready" if self.player1.ready else "Player 1 - Not ready", True, BLACK)
-        p1_rect = p1_text.get_rect(center=(text_rect.centerx, text_rect.centery + 50))
-        self.screen.blit(p1_text, p1_rect)
-
-        # Set up font and text for player 2 status
-        p2_font = pygame.font.Font(None, 30)
-        p2_text = p2_font.render("Player 2 - Ready" if self.player2.ready else "Player 2 - Not ready", True, BLACK)
-        p2_rect = p2_text.get_rect(center=(text_rect.centerx, text_rect.centery + 100))
-        self.screen.blit(p2_text, p2_rect)
+        # Both versions of each player's status line, red while not ready
+        status_font = pygame.font.Font(None, 30)
+        players = (self.player1, self.player2)
+        status = [(status_font.render("Player {} - Not ready".format(number), True, RED),
+                   status_font.render("Player {} - Ready".format(number), True, BLACK)) for number in (1, 2)]
 
-        # Update the display
-        pygame.display.flip()
-
-        # Wait for both players to be ready
+        # Wait for both players to be ready, sleeping on the event queue and only redrawing when a status changes
+        changed = True
         while not (self.player1.ready and self.player2.ready):
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-                elif event.type == pygame.JOYBUTTONDOWN and event.button == 7:
-                    if event.joy == 0:
-                        self.player1.ready = True
-                    elif event.joy == 1:
-                        self.player2.ready = True
-                elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_RETURN:
-                       self.player1.ready = True
-                    if event.key == pygame.K_e:
-                       self.player2.ready = True
-            screen.fill((255, 255, 255))
-            # Draw the text
-            self.screen.fill(WHITE)
-            self.screen.blit(text, text_rect)
-
-            # Update the player status text
-            p1_color = BLACK if self.player1.ready else RED
-            p1_text = p1_font.render("Player 1 - Ready" if self.player1.ready else "Player 1 - Not ready", True, p1_color)
-            p1_rect = p1_text.get_rect(center=(text_rect.centerx, text_rect.centery + 50))
-            self.screen.blit(p1_text, p1_rect)
-            p2_color = BLACK if self.player2.ready else RED
-            p2_text = p2_font.render("Player 2 - Ready" if self.player2.ready else "Player 2 - Not ready", True, p2_color)
-            p2_rect = p2_text.get_rect(center=(text_rect.centerx, text_rect.centery + 100))
-            self.screen.blit(p2_text, p2_rect)
-          
-            # Update the display
-            pygame.display.flip()
-
-            # Wait a bit to avoid using too much CPU
-            pygame.time.wait(10)
+            if changed:
+                self.screen.fill(WHITE)
+                self.screen.blit(text, text_rect)
+                for index, player in enumerate(players):
+                    line = status[index][player.ready]
+                    self.screen.blit(line, line.get_rect(center=(text_rect.centerx, text_rect.centery + 50 * (index + 1))))
+                pygame.display.flip()
+                changed = False
+
+            event = pygame.event.wait(IDLE_TIMEOUT)
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                sys.exit()
+            self.input.handle_event(event)
+            for index, player in enumerate(players):
+                if self.input.start_pressed(index) and not player.ready:
+                    player.ready = True
+                    changed = True
+
     def update(self, dt):
-        # Update the timer for block falling
+        # Move the blocks down one row every fall_speed seconds, however fast frames are drawn
         self.fall_timer += dt
+        while self.fall_timer >= self.fall_speed:
+            self.fall_timer -= self.fall_speed
+            self.player1.update()
+            self.player2.update()
 
     def run(self):
       
@@ -360,17 +318,9 @@ class Game:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     self.game_over = True
-            joystick_count = pygame.joystick.get_count()
-            if joystick_count < 2:
-                self.player1.handle_input()  # keyboard input
-                self.player2.handle_input()  # keyboard input
-            else:
-                joystick1 = pygame.joystick.Joystick(0)
-                joystick2 = pygame.joystick.Joystick(1)
-                joystick1.init()
-                joystick2.init()
-                self.player1.handle_input(joystick1)  # joystick input
-                self.player2.handle_input(joystick2)  # joystick input
+                self.input.handle_event(event)
+            self.player1.handle_input(self.input.tick(0))
+            self.player2.handle_input(self.input.tick(1))
 
             dt = self.clock.tick(FPS) / 1000.0
             self.update(dt)
@@ -378,8 +328,10 @@ class Game:
         pygame.quit()
     
 
-pygame.init()
-screen = pygame.display.set_mode((800, 600))
-size = (800, 600)
-game = Game(screen, size)
-game.run()
+if __name__ == "__main__":
+    pygame.init()
+    screen = pygame.display.set_mode((800, 600))
+    size = (800, 600)
+    game = Game(screen, size)
+    game.run()
+
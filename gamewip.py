@@ -1,6 +1,22 @@
+import argparse
+import os
+import random
+import sys
+import time
 
 import pygame
-import random
+
+from ai import AIController, LEVELS
+from assets import assets
+from canvas import ScaledDisplay, CANVAS_SIZE, SCALING_MODES
+from controls import InputManager, START
+from engine import Engine, LEFT, RIGHT, ROTATE, DROP
+from netplay import Channel, RollbackSession, host, join
+from pool import Pool
+from profiler import FrameProfiler, OVERLAY_RECT
+from replay import Replay, ReplayRecorder
+from timestep import FixedTimestep
+from textures import textures
 
 # Define some colors
 BLACK, WHITE, BLUE, RED, YELLOW, GRAY = (0, 0, 0), (255, 255, 255), (0, 0, 255), (255, 0, 0), (255, 255, 0), (128, 128, 128)
@@ -8,189 +24,399 @@ BLACK, WHITE, BLUE, RED, YELLOW, GRAY = (0, 0, 0), (255, 255, 255), (0, 0, 255),
 # Define the size of the game grid and blocks
 GRID_WIDTH, GRID_HEIGHT, BLOCK_SIZE = 8, 12, 64
 
+# Game logic ticks per second, and how many ticks it takes a set to fall one row
+TICK_RATE, GRAVITY = 60, 12
+
+# Frames per second limit (0 for no limit) and whether to wait for the display's vertical sync
+FRAME_CAP, VSYNC = 120, True
+
+# Longest time in milliseconds the splash and game-over screens sleep waiting for an event
+IDLE_TIMEOUT = 500
+
+# Number of upcoming sets each player can see
+PREVIEW_LENGTH = 3
+
+# Key that turns the frame profiler and its overlay on and off
+PROFILER_KEY = pygame.K_F3
+
+# Every match is recorded here as a replay file (see replay.py), None turns recording off
+REPLAY_DIR = "replays"
+
+# Optional image tiled under the empty cells (an assets.MANIFEST name such as "grid_bg"), None keeps the plain gray board
+GRID_BACKGROUND = None
+
+# Switches between integer and smooth scaling of the canvas to the display, see canvas.py
+SCALING_KEY = pygame.K_F4
+
+# Smallest gap in pixels between two boards and between a board and the edge of the screen
+LAYOUT_PADDING = 40
+
 
 class Block:
+    __slots__ = ("x", "y", "block_type")
+
     def __init__(self, x, y, block_type):
+        self.reset(x, y, block_type)
+
+    def reset(self, x, y, block_type):
         self.x = x
         self.y = y
         self.block_type = block_type
-        if block_type == 1:
-            self.texture = "wood.png"
-        elif block_type == 2:
-            self.texture = "rock.png"
-        elif block_type == 3:
-            self.texture = "diamond.png"
-        elif block_type == 4:
-            self.texture = "bomb.png"
-        elif block_type == 5:
-            self.texture = "missile.png"
-        self.texture = pygame.image.load(self.texture).convert_alpha()
-        self.texture = pygame.transform.scale(self.texture, (BLOCK_SIZE, BLOCK_SIZE))
-
-    def draw(self, screen):
-        screen.blit(self.texture, (self.x, self.y))
-    
-#class for the player, including the grid, blocks, and the next set of blocks, 
-#ensure a set of blocks only spawns after the current one has reached the bottom of the grid
+
+    def draw(self, screen, block_size=BLOCK_SIZE):
+        # Textures are shared between all blocks, see textures.py
+        screen.blit(textures.get(self.block_type, block_size), (self.x, self.y))
+
+# Falling blocks are reused from set to set instead of being made again every tick, see pool.py
+BLOCKS = Pool(Block)
+
+# Keyboard controls for each player: player 1 uses the arrow keys and space bar to rotate, player 2 uses a, d, s and q to rotate.
+# Player 1 starts with 'e' and player 2 with Enter
+PLAYER1_CONTROLS = {pygame.K_LEFT: LEFT, pygame.K_RIGHT: RIGHT, pygame.K_SPACE: ROTATE, pygame.K_DOWN: DROP, pygame.K_e: START}
+PLAYER2_CONTROLS = {pygame.K_a: LEFT, pygame.K_d: RIGHT, pygame.K_q: ROTATE, pygame.K_s: DROP, pygame.K_RETURN: START}
+
+
+#class for the player, the rules live in engine.Engine, the player turns input into actions and draws the engine's board
 class Player:
-    def __init__(self, x, y, block_size, grid_size):
+    def __init__(self, x, y, block_size, grid_size, seed=None, engine=None, background=None):
         self.x = x
         self.y = y
-        self.grid = [[0] * GRID_WIDTH for _ in range(GRID_HEIGHT)]
+        # A replay passes in engines set up with the recorded settings
+        self.engine = engine or Engine(GRID_WIDTH, GRID_HEIGHT, seed, GRAVITY, preview=PREVIEW_LENGTH)
+        # Falling set before the last tick, used to interpolate between ticks
+        self.prev_cells = self.engine.cells
+        self.prev_pieces = self.engine.pieces
+        self.grid = self.engine.board
+        # Actions collected from input since the last update, sent to the engine as one bitmask
+        self.actions = 0
         self.blocks = []
+        self.ghost = []  # (x, y, block_type) of the landing preview
+        self.next_blocks = []  # block types of the upcoming sets, first one spawns next
+        # Dirty-rect rendering state: changed cells and the falling blocks (x, y, block_type) drawn last frame
+        self.dirty = set()
+        self.drawn_blocks = []  # [x, y, block_type] lists, updated in place
+        self.drawn_ghost = []
+        # The falling cells and set number the blocks, ghost and preview were last worked out for
+        self.synced_cells = None
+        self.synced_pieces = None
+        self.full_redraw = True
         self.block_size = block_size
         self.grid_size = grid_size
-        self.next_blocks = []  # store the next set of blocks here
-        self.generate_blocks()  # generate the first set of blocks
         self.is_ready = False
-        self.timer = pygame.time.get_ticks()   # Initialize the timer
-        self.speed = 5
-    #check for input to control position of the blocks, player 1 uses arrow keys and space bar to rotate, player 2 uses w,a,s,d and q to rotate
-    def check_input(self, event):
-        if event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_LEFT:
-                self.move_left()
-            elif event.key == pygame.K_RIGHT:
-                self.move_right()
-            elif event.key == pygame.K_SPACE:
-                self.rotate()
-            elif event.key == pygame.K_DOWN:
-                self.drop()
-        elif event.type == pygame.KEYUP:
-            if event.key == pygame.K_DOWN:
-                self.ready()
-        elif event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_a:
-                self.move_left()
-            elif event.key == pygame.K_d:
-                self.move_right()
-            elif event.key == pygame.K_q:
-                print("rotate")
-                self.rotate()
-            elif event.key == pygame.K_s:
-                self.drop()
-        elif event.type == pygame.KEYUP:
-            if event.key == pygame.K_s:
-                self.ready()
-    
-    def generate_blocks(self):
-            # Generate a random L-shaped block (2 blocks wide and 2 blocks tall), that falls down the grid slowly and can be controlled by players - a new set will only generate once the current set has reached the bottom of the grid
-            self.blocks = []
-            block_type = random.randint(1, 5)
-            self.blocks.append(Block(self.x + self.grid_size[0] // 2 - self.block_size, self.y, block_type))
-            block_type = random.randint(1, 5)
-            self.blocks.append(Block(self.x + self.grid_size[0] // 2, self.y, block_type))
-            block_type = random.randint(1, 5)
-            self.blocks.append(Block(self.x + self.grid_size[0] // 2, self.y + self.block_size, block_type))
-            self.ready = True
+        self.sync_blocks()
+        self.build_layers(background)
 
     def move_left(self):
-        for block in self.blocks:
-            block.x -= self.block_size
-            if block.x < self.x or self.check_collision():
-                block.x += self.block_size
-                break
-    
+        self.actions |= LEFT
+
     def move_right(self):
-        for block in self.blocks:
-            block.x += self.block_size
-            if block.x >= self.x + self.grid_size[0] or self.check_collision():
-                block.x -= self.block_size
-                break
-    
+        self.actions |= RIGHT
+
     def rotate(self):
-        # Rotate the blocks clockwise
-        for block in self.blocks:
-            temp_x = block.x
-            temp_y = block.y
-            block.x = self.blocks[1].x + self.blocks[1].y - temp_y
-            block.y = self.blocks[1].y - self.blocks[1].x + temp_x
-            if block.x < self.x or block.x >= self.x + self.grid_size[0] or block.y >= self.y + self.grid_size[1] or self.check_collision():
-                block.x = temp_x
-                block.y = temp_y
-                break
-    
+        self.actions |= ROTATE
+
     def drop(self):
-        # Drop the blocks to the bottom of the grid
-        for block in self.blocks:
-            block.y += self.block_size
-            while block.y < self.y + self.grid_size[1] and not self.check_collision():
-                block.y += self.block_size
-            block.y -= self.block_size
-            self.add_to_grid()
-            self.generate_blocks()
-            if self.check_game_over():
-                self.game_over = True
-            break
-    
+        self.actions |= DROP
+
     def ready(self):
         self.is_ready = True
-    
-    def check_collision(self):
-        # Check if the blocks collide with the grid or other blocks, if a block hits the bottom of the grid he set should be added to the grid and each block should be set on top of the last row of the grid
-        for block in self.blocks:
-            if block.y >= self.y + self.grid_size[1]:
-                return True
-            if self.grid[(block.y - self.y) // self.block_size][(block.x - self.x) // self.block_size] != 0:
-                return True
-        return False
-
-    def add_to_grid(self):
-        # Add the full set to the grid, 
-        for block in self.blocks:
-            self.grid[(block.y - self.y) // self.block_size][(block.x - self.x) // self.block_size] = block.block_type
- 
-    def check_game_over(self):
-        # Check if the game is over
-        for block in self.blocks:
-            if block.y == self.y:
-                return True
-        return False
 
-    def update(self):
-        # Update the blocks
-        if self.ready:
-            for block in self.blocks:
-                block.y += self.block_size
-                if block.y >= self.y + self.grid_size[1] or self.check_collision():
-                    block.y -= self.block_size
-                    self.add_to_grid()
-                    self.generate_blocks()
-                    if self.check_game_over():
-                        self.game_over = True
-                    break
-        else:
-            if pygame.time.get_ticks() - self.timer >= 1000:
-                self.timer = pygame.time.get_ticks()
-                self.ready = True
-
-    def draw(self, screen):
-        # Fill the empty cells with a gray background color
-        for row in range(GRID_HEIGHT):
-            for col in range(GRID_WIDTH):
-                if self.grid[row][col] == 0:
-                    pygame.draw.rect(screen, GRAY, [self.x + col * self.block_size, self.y + row * self.block_size, self.block_size, self.block_size])
+    @property
+    def game_over(self):
+        return self.engine.game_over
 
-        # Draw the grid lines
-        for i in range(GRID_WIDTH + 1):
-            pygame.draw.line(screen, BLACK, (self.x + i * self.block_size, self.y), (self.x + i * self.block_size, self.y + self.grid_size[1]))
-        for i in range(GRID_HEIGHT + 1):
-            pygame.draw.line(screen, BLACK, (self.x, self.y + i * self.block_size), (self.x + self.grid_size[0], self.y + i * self.block_size))
+    def check_collision(self):
+        # Check if the falling blocks collide with the walls, the floor or landed blocks
+        return not self.grid.fits([self.cell(block) for block in self.blocks])
+
+    def cell(self, block):
+        # Convert a block's pixel position to its (row, col) on the grid
+        return (block.y - self.y) // self.block_size, (block.x - self.x) // self.block_size
+
+    def sync_blocks(self):
+        # Position the falling blocks from the engine's falling set, the Block objects are kept and only
+        # taken from or given back to the pool when the set has another number of blocks. The engine
+        # replaces its cells whenever the set moves and the board only changes when a set lands, so
+        # nothing needs working out again on the ticks where neither happened
+        engine = self.engine
+        cells, blocks = engine.cells, self.blocks
+        if cells is self.synced_cells and engine.pieces == self.synced_pieces and not engine.landed:
+            return
+        while len(blocks) < len(cells):
+            blocks.append(BLOCKS.acquire(0, 0, 0))
+        if len(blocks) > len(cells):
+            BLOCKS.release(blocks[len(cells):])
+            del blocks[len(cells):]
+        for block, (row, col), block_type in zip(blocks, cells, engine.types):
+            block.reset(self.x + col * self.block_size, self.y + row * self.block_size, block_type)
+        if engine.pieces != self.synced_pieces:
+            self.next_blocks = engine.randomizer.preview()
+        self.ghost = [(self.x + col * self.block_size, self.y + row * self.block_size, block_type)
+                      for (row, col), block_type in zip(engine.ghost_cells(), engine.types)]
+        self.synced_cells = cells
+        self.synced_pieces = engine.pieces
+
+    def interpolate(self, alpha):
+        # Place the falling blocks between their position before and after the last tick,
+        # a set that just spawned is drawn where it is
+        if self.prev_pieces != self.engine.pieces:
+            return
+        for block, (prev_row, prev_col), (row, col) in zip(self.blocks, self.prev_cells, self.engine.cells):
+            block.x = self.x + round((prev_col + (col - prev_col) * alpha) * self.block_size)
+            block.y = self.y + round((prev_row + (row - prev_row) * alpha) * self.block_size)
 
-        # Draw the landed blocks
+    def update(self):
+        # Advance the engine one tick with the collected actions
+        self.prev_cells = self.engine.cells
+        self.prev_pieces = self.engine.pieces
+        self.engine.step(self.actions)
+        self.actions = 0
+        self.stepped()
+
+    def stepped(self):
+        # Repaint what the engine's last step changed
+        for row, col in self.engine.landed:
+            self.mark_dirty(row, col)
+        for step in self.engine.cascade:
+            for row, col in step.cleared:
+                self.mark_dirty(row, col)
+            for col, from_row, to_row in step.moves:
+                self.mark_dirty(from_row, col)
+                self.mark_dirty(to_row, col)
+        self.sync_blocks()
+
+    def refresh(self):
+        # The engine jumped to another state (a netplay rollback), redraw the whole board from it
+        self.prev_cells = self.engine.cells
+        self.prev_pieces = self.engine.pieces
+        self.rebuild_layer()
+        self.synced_cells = self.synced_pieces = None
+        self.sync_blocks()
+
+    def build_layers(self, background=None):
+        # The static board background, shared by all the boards of a match when one is given, call again
+        # whenever the block size or display mode changes
+        self.background = background or build_background(self.block_size, self.grid_size)
+        # Paints over cells outside the grid, where the falling set can be before it enters
+        self.blank = pygame.Surface((self.block_size, self.block_size)).convert()
+        self.blank.fill(WHITE)
+        self.rebuild_layer()
+
+    def rebuild_layer(self):
+        # Second layer: the background with the landed blocks composited on top, only touched when the grid changes
+        self.layer = self.background.copy()
         for row in range(GRID_HEIGHT):
             for col in range(GRID_WIDTH):
-                if self.grid[row][col] != 0:
-                    block_type = self.grid[row][col]
-                    block = Block(self.x + col * self.block_size, self.y + row * self.block_size, block_type)
-                    block.draw(screen)
+                if self.grid.get(row, col) != 0:
+                    self.compose_cell(row, col)
+        self.full_redraw = True
+
+    def compose_cell(self, row, col):
+        # Rebuild one cell of the landed-block layer from the background
+        area = pygame.Rect(col * self.block_size, row * self.block_size, self.block_size, self.block_size)
+        self.layer.blit(self.background, area, area)
+        block_type = self.grid.get(row, col)
+        if block_type != 0:
+            self.layer.blit(textures.get(block_type, self.block_size), area)
+
+    def mark_dirty(self, row, col):
+        # A grid cell changed, update the landed-block layer and repaint the cell on the next draw
+        self.compose_cell(row, col)
+        self.dirty.add((row, col))
+
+    def invalidate(self):
+        # Force a full repaint of the board on the next draw
+        self.full_redraw = True
+
+    def cell_rect(self, row, col):
+        return pygame.Rect(self.x + col * self.block_size, self.y + row * self.block_size, self.block_size, self.block_size)
+
+    def cells_under(self, x, y):
+        # The cells a block drawn at pixel (x, y) covers, up to four when it sits between cells
+        top, left = (y - self.y) // self.block_size, (x - self.x) // self.block_size
+        bottom, right = (y - self.y + self.block_size - 1) // self.block_size, (x - self.x + self.block_size - 1) // self.block_size
+        return {(top, left), (top, right), (bottom, left), (bottom, right)}
+
+    def draw(self, screen, alpha=1.0):
+        # Only repaint what changed since the last frame and return the changed rects for pygame.display.update
+        blits, rects = [], []
+        self.draw_commands(blits, rects, alpha)
+        screen.blits(blits, False)
+        return rects
+
+    def draw_commands(self, blits, rects, alpha=1.0):
+        # Add what draw paints to blits, as (source, dest[, area]) for Surface.blits, and the changed rects to
+        # rects, so a match can paint every board with a single blits call
+        self.interpolate(alpha)
+        if self.full_redraw:
+            self.draw_full(blits, rects)
+            return
+
+        if self.blocks_moved():
+            # The falling set moved or changed, repaint the cells it left and the cells it entered
+            for x, y, _ in self.drawn_blocks:
+                self.dirty |= self.cells_under(x, y)
+            for block in self.blocks:
+                self.dirty |= self.cells_under(block.x, block.y)
+        if self.ghost != self.drawn_ghost:
+            for x, y, _ in self.drawn_ghost:
+                self.dirty |= self.cells_under(x, y)
+            for x, y, _ in self.ghost:
+                self.dirty |= self.cells_under(x, y)
+        if not self.dirty:
+            return
+
+        for row, col in self.dirty:
+            rect = self.cell_rect(row, col)
+            if 0 <= row < GRID_HEIGHT and 0 <= col < GRID_WIDTH:
+                blits.append((self.layer, rect, rect.move(-self.x, -self.y)))
+            else:
+                blits.append((self.blank, rect))
+            rects.append(rect)
+
+        # Draw the landing preview and the falling blocks that sit on a repainted cell
+        for x, y, block_type in self.ghost:
+            if not self.dirty.isdisjoint(self.cells_under(x, y)):
+                blits.append((textures.ghost(block_type, self.block_size), (x, y)))
+        for block in self.blocks:
+            if not self.dirty.isdisjoint(self.cells_under(block.x, block.y)):
+                blits.append((textures.get(block.block_type, self.block_size), (block.x, block.y)))
+
+        self.dirty.clear()
+        self.remember_blocks()
+        self.drawn_ghost = self.ghost
+
+    def blocks_moved(self):
+        # Whether the falling blocks were drawn anywhere else or as other types last frame. A new set can
+        # spawn right where the last one was, so the block types count as well as the positions
+        drawn, blocks = self.drawn_blocks, self.blocks
+        if len(drawn) != len(blocks):
+            return True
+        for (x, y, block_type), block in zip(drawn, blocks):
+            if x != block.x or y != block.y or block_type != block.block_type:
+                return True
+        return False
 
-        # Draw the falling blocks
+    def remember_blocks(self):
+        # Keep where the falling blocks were drawn, in place so drawing doesn't make new lists every frame
+        drawn, blocks = self.drawn_blocks, self.blocks
+        del drawn[len(blocks):]
+        while len(drawn) < len(blocks):
+            drawn.append([0, 0, 0])
+        for position, block in zip(drawn, blocks):
+            position[0], position[1], position[2] = block.x, block.y, block.block_type
+
+    def draw_full(self, blits, rects):
+        # The background, grid lines and landed blocks are all in the cached layer
+        blits.append((self.layer, (self.x, self.y)))
+        rects.append(pygame.Rect(self.x, self.y, self.layer.get_width(), self.layer.get_height()))
+
+        # Blocks drawn above the grid last frame are outside the layer, paint over them
+        for x, y, _ in self.drawn_blocks:
+            for row, col in self.cells_under(x, y):
+                if row < 0:
+                    rect = self.cell_rect(row, col)
+                    blits.append((self.blank, rect))
+                    rects.append(rect)
+
+        # Draw the landing preview and the falling blocks
+        for x, y, block_type in self.ghost:
+            blits.append((textures.ghost(block_type, self.block_size), (x, y)))
         for block in self.blocks:
-            block.draw(screen)
+            blits.append((textures.get(block.block_type, self.block_size), (block.x, block.y)))
+
+        self.full_redraw = False
+        self.dirty.clear()
+        self.drawn_ghost = self.ghost
+        self.remember_blocks()
+
+
+def build_background(block_size, grid_size):
+    # Pre-render the static board background (gray cells, grid lines, optional tile image) once
+    width, height = grid_size[0] + 1, grid_size[1] + 1
+    background = pygame.Surface((width, height)).convert()
+    background.fill(GRAY)
+    if GRID_BACKGROUND is not None:
+        tile = assets.get(GRID_BACKGROUND)
+        for tile_x in range(0, width, tile.get_width()):
+            for tile_y in range(0, height, tile.get_height()):
+                background.blit(tile, (tile_x, tile_y))
+    for i in range(GRID_WIDTH + 1):
+        pygame.draw.line(background, BLACK, (i * block_size, 0), (i * block_size, grid_size[1]))
+    for i in range(GRID_HEIGHT + 1):
+        pygame.draw.line(background, BLACK, (0, i * block_size), (grid_size[0], i * block_size))
+    return background
+
+
+def layout(count, size, max_block_size=BLOCK_SIZE):
+    # Arrange count boards in the grid of columns and rows that allows the biggest blocks (up to max_block_size),
+    # the fewest columns when it's a tie, spread evenly over the screen. Returns (block size, [(x, y) per board])
+    width, height = size
+    best = None
+    for columns in range(1, count + 1):
+        rows = -(-count // columns)
+        block_size = min((width - LAYOUT_PADDING * (columns + 1)) // (columns * GRID_WIDTH),
+                         (height - LAYOUT_PADDING * (rows + 1)) // (rows * GRID_HEIGHT), max_block_size)
+        if best is None or block_size > best[0]:
+            best = (block_size, columns, rows)
+    block_size, columns, rows = best
+    board_width, board_height = GRID_WIDTH * block_size, GRID_HEIGHT * block_size
+    gap_x = (width - columns * board_width) // (columns + 1)
+    gap_y = (height - rows * board_height) // (rows + 1)
+    return block_size, [(gap_x + (index % columns) * (board_width + gap_x), gap_y + (index // columns) * (board_height + gap_y))
+                        for index in range(count)]
+
+
+# Any number of player boards laid out on one screen. The boards share the block textures and one
+# background surface, are stepped together and painted with a single Surface.blits call per frame
+class Match:
+    def __init__(self, count, size, seed, engines=None):
+        self.block_size, positions = layout(count, size)
+        grid_size = (GRID_WIDTH * self.block_size, GRID_HEIGHT * self.block_size)
+        self.background = build_background(self.block_size, grid_size)
+        engines = engines or [None] * count
+        self.players = [Player(x, y, self.block_size, grid_size, seed, engine, self.background)
+                        for (x, y), engine in zip(positions, engines)]
+        # The blits and rects of a frame, the same two lists every frame
+        self.blits, self.rects = [], []
+
+    def update(self, actions):
+        # One tick for every board, actions has one bitmask per player
+        for player, action in zip(self.players, actions):
+            player.actions |= action
+            player.update()
+
+    def draw(self, screen, alpha=1.0):
+        # Repaint what changed on every board, returns the rects for pygame.display.update. The list is
+        # reused, it is only good until the next draw
+        blits, rects = self.blits, self.rects
+        rects.clear()
+        for player in self.players:
+            player.draw_commands(blits, rects, alpha)
+        if blits:
+            screen.blits(blits, False)
+            blits.clear()
+        return rects
+
+    def invalidate(self):
+        for player in self.players:
+            player.invalidate()
+
+    def finished(self):
+        # A match is over when at most one board is still going (a single board plays until it fills up)
+        playing = sum(not player.game_over for player in self.players)
+        return playing == 0 or (playing == 1 and len(self.players) > 1)
+
+    def winner(self):
+        # Number (1-based) of the last board still going, None for a draw
+        for number, player in enumerate(self.players, 1):
+            if not player.game_over:
+                return number
+        return None
+
 
 class Game:
-    def __init__(self):
+    def __init__(self, replay=None, net=None, profile=None, ai=None, players=2, scaling="integer"):
         # Initialize Pygame
         pygame.init()
 
@@ -199,103 +425,156 @@ class Game:
         width = display_info.current_w
         height = display_info.current_h
 
-        # Set the size of the screen to the current display size
-        self.size = (width, height)
-        self.screen = pygame.display.set_mode(self.size, pygame.FULLSCREEN)
+        # Go fullscreen, the game draws on a canvas of CANVAS_SIZE whatever the display is and canvas.py
+        # scales it to the display
+        self.display = ScaledDisplay((width, height), self.set_mode, CANVAS_SIZE, scaling)
+        self.size = CANVAS_SIZE
+        self.screen = self.display.canvas
 
         # Set the caption of the window
         pygame.display.set_caption("Game Prototype")
 
-        # Define the size and position of the grid areas on the screen
-        padding = 200
-        margin = (self.size[1] - (GRID_HEIGHT * BLOCK_SIZE)) // 2
-        grid_width = GRID_WIDTH * BLOCK_SIZE
-        grid_height = GRID_HEIGHT * BLOCK_SIZE
-
-        player1_x = (self.size[0] - (2 * grid_width + padding)) // 2
-        player1_y = margin
-        player2_x = player1_x + grid_width + padding
-        player2_y = margin
-
-        # Create the game grids for each player
-        self.player1_grid_size = (grid_width, grid_height)
-        self.player2_grid_size = (grid_width, grid_height)
-        self.player1 = Player(player1_x, player1_y, BLOCK_SIZE, self.player1_grid_size)
-        self.player2 = Player(player2_x, player2_y, BLOCK_SIZE, self.player2_grid_size)
+        # Every player shares one seed so they all get the same sequence of blocks. A replay brings its
+        # own seed, settings and number of players and drives the players from its recorded actions
+        # instead of the input. A networked match is always two players and gets its seed from the host
+        self.replay = replay
+        if replay is not None:
+            self.seed = replay.seed
+            players = replay.players
+        elif net is not None:
+            self.seed = net[2]
+            players = 2
+        else:
+            self.seed = random.randrange(2 ** 32)
+
+        # Lay the boards out on the screen, they all share one background and the block textures
+        self.match = Match(players, self.size, self.seed, replay.engines() if replay is not None else None)
+        self.players = self.match.players
+
+        # Decode the block textures in the background while the splash screen is up
+        textures.preload_async(self.match.block_size)
+
+        # net is (channel, index of the local player, seed), the session steps both engines
+        self.session = None
+        if net is not None:
+            self.session = RollbackSession([player.engine for player in self.players], net[1], net[0])
+        self.recorder = None
+        if replay is None and net is None and REPLAY_DIR is not None:
+            self.recorder = ReplayRecorder(self.seed, TICK_RATE, GRAVITY, GRID_WIDTH, GRID_HEIGHT, players, PREVIEW_LENGTH)
+
+        # Keyboard and gamepads, opened once and kept up to date as pads are plugged in and out
+        # Players after the second have no keys and play with a gamepad
+        self.input = InputManager(([PLAYER1_CONTROLS, PLAYER2_CONTROLS] + [{}] * players)[:players])
+
+        # With an AI level (see ai.LEVELS) the CPU plays every player but the first, they are always ready.
+        # controllers has one AIController or None (input from the InputManager) per player
+        self.controllers = [None] * players
+        if ai is not None:
+            for index, player in enumerate(self.players[1:], 1):
+                self.controllers[index] = AIController(player.engine, ai, self.seed + index)
+                player.ready()
+
+        # Frame profiler, off until PROFILER_KEY is pressed. With a profile path it starts on, keeps every
+        # frame and writes them there (.json for a Chrome trace, anything else CSV) when the game ends
+        self.profile = profile
+        self.profiler = FrameProfiler(record=profile is not None)
+        # The InputManager updates this list in place, the overlay shows it
+        self.profiler.input_latency = self.input.latency
+        if profile is not None:
+            self.profiler.toggle()
     
     
-    # create a method to display a splash screen, two players need to press the start button on the joypad or on keyboard before the game can start
-    # for player 1, the start button is 'e'and for player 2 the start button is Enter
+    def set_mode(self, size, flags):
+        # Ask for vsync when enabled. pygame only does vsync through SDL's renderer, which it uses with
+        # SCALED (or OPENGL), so vsync comes with SCALED. At the display size the renderer doesn't resize
+        # anything, at the canvas size it does the scaling. Not every driver can do vsync so fall back to
+        # the mode without it
+        if VSYNC:
+            try:
+                return pygame.display.set_mode(size, flags | pygame.SCALED, vsync=1)
+            except pygame.error:
+                pass
+        return pygame.display.set_mode(size, flags)
+
+    # create a method to display a splash screen, every player needs to press the start button on the joypad or on keyboard before the game can start
+    # for player 1, the start button is 'e'and for player 2 the start button is Enter, players after that use the Start button of their joypad
     def splash_screen(self):
-        # Create a font
+        # Render all the text once, including both states of each player's status line
         font = pygame.font.SysFont("Calibri", 25, True, False)
-
-        # Render the text
         text = font.render("Press 'e' for player 1 and Enter for player 2 to start the game", True, BLACK)
-
-        # Get the size of the text (why is font.size a string?)
-        text_size = font.size("Press 'e' for player 1 and Enter for player 2 to start the game")
-        # Get the position of the text
-        text_x = (self.size[0] - text_size[0]) // 2
-        text_y = (self.size[1] - text_size[1]) // 2
-        # fill entire screen with white
-        self.screen.fill(WHITE)
-        # Draw the text on the screen
-        self.screen.blit(text, [text_x, text_y])
-
-        # Update the screen
-        pygame.display.flip()
-
-        # Wait for the player to press the start button
-        while True:
-            for event in pygame.event.get():
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_e:
-                        self.player1.is_ready=True
-                    if event.key == pygame.K_RETURN:
-                        self.player2.is_ready=True
-                    if self.player1.is_ready == True and self.player2.is_ready == True:
-                        # Both players are ready, break out of the while loop
-                        self.run()
-            self.screen.fill(WHITE)
-            self.screen.blit(text, [text_x, text_y])
-            pygame.display.flip()
-
+        text_rect = text.get_rect(center=(self.size[0] // 2, self.size[1] // 2))
+        players = self.players
+        status = [(font.render("Player {} - Not ready".format(number), True, RED),
+                   font.render("Player {} - Ready".format(number), True, BLACK)) for number in range(1, len(players) + 1)]
+
+        # Sleep until something happens and only redraw when a player's status changes
+        changed = True
+        while not all(player.is_ready for player in players):
+            if changed:
+                self.screen.fill(WHITE)
+                self.screen.blit(text, text_rect)
+                for index, player in enumerate(players):
+                    line = status[index][player.is_ready]
+                    self.screen.blit(line, line.get_rect(center=(text_rect.centerx, text_rect.centery + 50 * (index + 1))))
+                self.display.present()
+                changed = False
+
+            self.wait_event()
+            for index, player in enumerate(players):
+                if self.input.start_pressed(index) and not player.is_ready:
+                    player.ready()
+                    changed = True
 
     def game_over_screen(self, player):
-        # Create a font
+        # Render the text once, it stays on screen until a player presses start. player is None for a draw
         font = pygame.font.SysFont("Calibri", 25, True, False)
-
-        # Render the text
-        text = font.render("Player {} wins!".format(player), True, BLACK)
-
-        # Get the size of the text
-        text_size = font.size("Player {} wins!".format(player))
-
-        # Get the position of the text
-        text_x = (self.size[0] - text_size[0]) // 2
-        text_y = (self.size[1] - text_size[1]) // 2
-
-        # Draw the text on the screen
-        self.screen.blit(text, [text_x, text_y])
-
-        # Update the screen
-        pygame.display.flip()
+        text = font.render("Player {} wins!".format(player) if player is not None else "Draw!", True, BLACK)
+        self.screen.blit(text, text.get_rect(center=(self.size[0] // 2, self.size[1] // 2)))
+        self.display.present()
 
         # Wait for the player to press the start button
         while True:
-            for event in pygame.event.get():
-                if event.type == pygame.JOYBUTTONDOWN:
-                    if event.button == 7:
-                        return
-        
-   
-   
+            self.wait_event()
+            if any(self.input.start_pressed(index) for index in range(len(self.players))):
+                return
+
+    def wait_event(self):
+        # Block until the next event (or IDLE_TIMEOUT) so idle screens don't spin, quit on Escape or window close
+        event = pygame.event.wait(IDLE_TIMEOUT)
+        if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+            pygame.quit()
+            sys.exit()
+        self.input.handle_event(event)
+
     def run(self):
         # Game loop
         done = False
         clock = pygame.time.Clock()
+        timestep = FixedTimestep(TICK_RATE)
+
+        # Finish loading the block textures before the first frame
+        textures.preload(self.match.block_size)
+
+        # A replay is played back at normal speed until its recorded ticks run out
+        replay_actions = self.replay.actions() if self.replay is not None else None
+
+        # Paint the whole screen once, after that players only repaint their dirty cells
+        self.screen.fill(WHITE)
+        self.match.invalidate()
+        self.display.present()
+        profiler = self.profiler
         while not done:
+            # Profiling costs one flag check per phase when it's off
+            profiling = profiler.enabled
+            if profiling:
+                profiler.begin_frame()
+
+            # Sleep off the rest of the frame first, so presses made while sleeping are handled before the
+            # ticks that follow instead of waiting a whole frame
+            ticks = timestep.advance(clock.tick(FRAME_CAP) / 1000.0)
+            if profiling:
+                profiler.mark("wait")
+
             # check if Escape key is pressed amd exit the game if it is
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
@@ -303,27 +582,139 @@ class Game:
                 if event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_ESCAPE:
                         done = True
-                Player.check_input(self.player1, event)
-                Player.check_input(self.player2, event)
-
-                    
-              
-
-            # Update the game state
-            self.player1.update()
-            self.player2.update()
-
-            # Draw the game on the screen
-            self.screen.fill(WHITE)
-            self.player1.draw(self.screen)
-            self.player2.draw(self.screen)
-            pygame.display.flip()
-
-            # Limit to 60 frames per second
-            clock.tick(5)
+                    elif event.key == PROFILER_KEY:
+                        self.toggle_profiler()
+                    elif event.key == SCALING_KEY:
+                        # The window is opened again, show the whole canvas on it
+                        self.display.toggle_scaling()
+                        self.display.present()
+                self.input.handle_event(event)
+            if profiling:
+                profiler.mark("events")
+
+            # Run as many logic ticks as the time since the last frame calls for, input is read per tick
+            for _ in range(ticks):
+                if self.session is not None:
+                    self.net_tick()
+                    if profiling:
+                        profiler.mark("update")
+                    continue
+                if replay_actions is not None:
+                    actions = next(replay_actions, None)
+                    if actions is None:
+                        done = True
+                        break
+                else:
+                    actions = [self.input.tick(index) if controller is None else controller.actions()
+                               for index, controller in enumerate(self.controllers)]
+                    if self.recorder is not None:
+                        # Include the presses made through the Player methods since the last tick
+                        self.recorder.record([player.actions | action for player, action in zip(self.players, actions)])
+                if profiling:
+                    profiler.mark("input")
+                self.match.update(actions)
+                if profiling:
+                    profiler.mark("update")
+
+            # Draw the game on the screen in between ticks, only the rects that changed are sent to the display
+            rects = self.match.draw(self.screen, timestep.alpha)
+            if profiler.overlay:
+                rects.append(profiler.draw(self.screen))
+            if profiling:
+                profiler.mark("draw")
+            if rects:
+                self.display.present(rects)
+            if profiling:
+                profiler.mark("display")
+                profiler.end_frame()
+
+            # The last player whose board hasn't filled up wins, over the network the first board to fill up
+            # loses once the remote input is confirmed
+            if self.session is not None:
+                over = self.session.finished()
+            else:
+                over = self.match.finished()
+            if over:
+                self.save_replay()
+                self.game_over_screen(self.match.winner())
+                done = True
+
+        self.save_replay()
+        if self.profile is not None:
+            profiler.dump(self.profile)
 
         # Quit Pygame
         pygame.quit()
         sys.exit()
-game = Game()
-game.splash_screen()
\ No newline at end of file
+
+    def toggle_profiler(self):
+        self.profiler.toggle()
+        if not self.profiler.overlay:
+            # Paint over the overlay, the boards under it are repainted on the next draw
+            self.screen.fill(WHITE, OVERLAY_RECT)
+            self.match.invalidate()
+            self.display.present([OVERLAY_RECT])
+
+    def net_tick(self):
+        # One tick of a networked match, the local player always uses the player 1 controls
+        players = self.players
+        for player in players:
+            player.prev_cells = player.engine.cells
+            player.prev_pieces = player.engine.pieces
+        if not self.session.advance(self.input.tick(0)):
+            # Waiting for the other side to catch up
+            return
+        for player in players:
+            if self.session.rolled_back:
+                player.refresh()
+            else:
+                player.stepped()
+
+    def save_replay(self):
+        # Write the recorded match to REPLAY_DIR, named after the time it ended
+        if self.recorder is None:
+            return
+        replay = self.recorder.finish([player.engine for player in self.players])
+        os.makedirs(REPLAY_DIR, exist_ok=True)
+        replay.save(os.path.join(REPLAY_DIR, time.strftime("%Y%m%d-%H%M%S") + ".rpl"))
+        self.recorder = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multiplayer block game")
+    parser.add_argument("--replay", help="play back a recorded match (python replay.py FILE checks one without rendering)")
+    parser.add_argument("--host", type=int, metavar="PORT", help="host a networked match on this UDP port")
+    parser.add_argument("--join", metavar="HOST:PORT", help="join a networked match")
+    parser.add_argument("--latency", type=float, default=0, help="extra milliseconds added to every packet sent, for testing")
+    parser.add_argument("--jitter", type=float, default=0, help="up to this many more random milliseconds per packet")
+    parser.add_argument("--loss", type=float, default=0, help="fraction of packets to drop, for testing")
+    parser.add_argument("--players", type=int, default=2, help="number of boards, players after the second need a gamepad")
+    parser.add_argument("--ai", choices=sorted(LEVELS), help="let the computer play every player but the first at this level")
+    parser.add_argument("--scaling", choices=SCALING_MODES, default="integer",
+                        help="how the {}x{} canvas is scaled to the display, {} switches while playing".format(
+                            CANVAS_SIZE[0], CANVAS_SIZE[1], pygame.key.name(SCALING_KEY).upper()))
+    parser.add_argument("--profile", metavar="PATH", help="profile every frame and write the timings here (.json for a Chrome trace, else CSV)")
+    args = parser.parse_args()
+    replay = None
+    if args.replay:
+        try:
+            replay = Replay.load(args.replay)
+        except (OSError, ValueError) as error:
+            parser.error("can't play {}: {}".format(args.replay, error))
+    net = None
+    if args.host is not None or args.join:
+        shim = {"latency": args.latency / 1000.0, "jitter": args.jitter / 1000.0, "loss": args.loss}
+        if args.host is not None:
+            channel = Channel(args.host, **shim)
+            seed = random.randrange(2 ** 32)
+            print("Waiting for a player to join on port {}".format(args.host))
+            host(channel, seed)
+            net = (channel, 0, seed)
+        else:
+            address, port = args.join.rsplit(":", 1)
+            channel = Channel(peer=(address, int(port)), **shim)
+            net = (channel, 1, join(channel))
+    game = Game(replay, net, args.profile, args.ai, args.players, args.scaling)
+    if game.replay is None and game.session is None:
+        game.splash_screen()
+    game.run()
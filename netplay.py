@@ -0,0 +1,223 @@
+# Rollback netplay for the versus mode: both machines run the whole simulation (both engines) and only
+# send each other their own action bitmasks over UDP. The remote player's input for a tick usually
+# arrives a few ticks late, so the session keeps going with a guess (no input) and a snapshot of every
+# tick. When the real input turns out different, it restores the snapshot from that tick and runs the
+# ticks since then again, all within one frame.
+#
+# Packets, all little-endian:
+#   b"J"                                      joiner asking to play
+#   b"S" seed                                 host answering with the match seed
+#   b"I" ack first_tick count actions...      input for ticks first_tick.. first_tick + count - 1, and the
+#                                             last tick the sender has the other side's input for
+import heapq
+import random
+import socket
+import struct
+import time
+
+# Local input is applied this many ticks after it is pressed, hides that much latency without any rollback
+INPUT_DELAY = 2
+
+# Furthest the simulation may run ahead of the last tick both inputs are known for, past that it waits
+MAX_ROLLBACK = 8
+
+# Most actions in one input packet
+MAX_PACKET_INPUTS = 255
+
+# Seconds between handshake packets, and how long to keep trying
+HANDSHAKE_INTERVAL, HANDSHAKE_TIMEOUT = 0.1, 30.0
+
+INPUT_HEADER = struct.Struct("<cIIB")
+SEED_PACKET = struct.Struct("<cQ")
+
+
+# Non-blocking UDP socket with an optional latency and packet loss shim, to try the netcode over loopback:
+#   python gamewip.py --host 7000 --latency 80 --loss 0.05
+#   python gamewip.py --join 127.0.0.1:7000 --latency 80 --loss 0.05
+class Channel:
+    def __init__(self, port=0, peer=None, latency=0.0, jitter=0.0, loss=0.0, seed=None):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(("", port))
+        self.socket.setblocking(False)
+        self.peer = peer
+        # Latency and jitter in seconds, loss as the fraction of packets dropped, all applied when sending
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.rng = random.Random(seed)
+        self.delayed = []  # heap of (send time, order, packet)
+        self.order = 0
+
+    def send(self, packet):
+        if self.peer is None or self.rng.random() < self.loss:
+            return
+        if self.latency or self.jitter:
+            self.order += 1
+            heapq.heappush(self.delayed, (time.perf_counter() + self.latency + self.rng.random() * self.jitter, self.order, packet))
+        else:
+            self.socket.sendto(packet, self.peer)
+        self.flush()
+
+    def flush(self):
+        # Send the delayed packets whose time has come
+        now = time.perf_counter()
+        while self.delayed and self.delayed[0][0] <= now:
+            self.socket.sendto(heapq.heappop(self.delayed)[2], self.peer)
+
+    def receive(self):
+        # Every packet waiting on the socket, the sender becomes the peer if there was none yet
+        self.flush()
+        packets = []
+        while True:
+            try:
+                packet, address = self.socket.recvfrom(2048)
+            except (BlockingIOError, ConnectionResetError):
+                return packets
+            if self.peer is None:
+                self.peer = address
+            packets.append(packet)
+
+    def close(self):
+        self.socket.close()
+
+
+def host(channel, seed):
+    # Wait for a joiner and send it the seed, returns once the joiner has answered
+    deadline = time.perf_counter() + HANDSHAKE_TIMEOUT
+    joined = False
+    while time.perf_counter() < deadline:
+        for packet in channel.receive():
+            if packet[:1] == b"J":
+                joined = True
+                channel.send(SEED_PACKET.pack(b"S", seed))
+            elif packet[:1] == b"I" and joined:
+                # The joiner only sends input once it has the seed
+                return
+        if joined:
+            channel.send(SEED_PACKET.pack(b"S", seed))
+        time.sleep(HANDSHAKE_INTERVAL)
+    raise TimeoutError("nobody joined")
+
+
+def join(channel):
+    # Ask the host to play until it answers, returns the match seed
+    deadline = time.perf_counter() + HANDSHAKE_TIMEOUT
+    while time.perf_counter() < deadline:
+        channel.send(b"J")
+        time.sleep(HANDSHAKE_INTERVAL)
+        for packet in channel.receive():
+            if packet[:1] == b"S":
+                return SEED_PACKET.unpack(packet)[1]
+    raise TimeoutError("the host did not answer")
+
+
+# Runs both engines for a networked match. local is the index of the engine this machine controls (the
+# host plays 0, the joiner 1). Call advance once per tick with the local actions
+class RollbackSession:
+    def __init__(self, engines, local, channel, input_delay=INPUT_DELAY, max_rollback=MAX_ROLLBACK):
+        self.engines = engines
+        self.local = local
+        self.channel = channel
+        self.input_delay = input_delay
+        self.max_rollback = max_rollback
+        # Next tick to simulate
+        self.tick = 0
+        # Input per player and tick, the first input_delay ticks have none
+        self.inputs = [dict.fromkeys(range(input_delay), 0) for _ in engines]
+        # Last tick the remote input is known for, with every tick before it, and the last tick the
+        # remote side has acknowledged having the local input for
+        self.confirmed = input_delay - 1
+        self.acked = input_delay - 1
+        # Last tick there is local input for, and actions pressed while stalled that wait for the next one.
+        # An input may already be on its way to the other side, so it is never changed once it is set
+        self.latest = input_delay - 1
+        self.pending = 0
+        # The remote actions each unconfirmed tick was simulated with
+        self.guesses = {}
+        # Engine snapshots taken before simulating each tick that is not confirmed yet
+        self.snapshots = {}
+        # Number of ticks run again in the last advance, renderers redraw everything when it's not 0
+        self.rolled_back = 0
+
+    @property
+    def remote(self):
+        return 1 - self.local
+
+    def advance(self, actions):
+        # Simulate one tick, returns False when the remote side is too far behind and the tick was skipped
+        self.rolled_back = 0
+        self.pending |= actions
+        if self.tick + self.input_delay > self.latest:
+            self.latest = self.tick + self.input_delay
+            self.inputs[self.local][self.latest] = self.pending
+            self.pending = 0
+        self.send()
+        self.receive()
+
+        if self.tick - self.confirmed > self.max_rollback:
+            return False
+        self.simulate(self.tick)
+        self.tick += 1
+        self.trim()
+        return True
+
+    def trim(self):
+        # Forget what no rollback, resend or upcoming tick can need any more: nothing rolls back to a
+        # confirmed tick, and local inputs are kept until the other side has acknowledged them
+        done = min(self.confirmed, self.tick - 1)
+        for tick in [tick for tick in self.snapshots if tick <= done]:
+            del self.snapshots[tick]
+        remote_inputs, local_inputs = self.inputs[self.remote], self.inputs[self.local]
+        for tick in [tick for tick in remote_inputs if tick <= done]:
+            del remote_inputs[tick]
+        for tick in [tick for tick in local_inputs if tick <= min(done, self.acked)]:
+            del local_inputs[tick]
+
+    def simulate(self, tick):
+        self.snapshots[tick] = [engine.snapshot() for engine in self.engines]
+        actions = [inputs.get(tick) for inputs in self.inputs]
+        if actions[self.remote] is None:
+            # Guess no input, the actions are single-tick presses so repeating the last one would be wrong more often
+            actions[self.remote] = self.guesses[tick] = 0
+        for engine, action in zip(self.engines, actions):
+            engine.step(action)
+
+    def receive(self):
+        remote_inputs = self.inputs[self.remote]
+        mispredicted = None
+        for packet in self.channel.receive():
+            if packet[:1] != b"I":
+                continue
+            _, ack, first, count = INPUT_HEADER.unpack_from(packet)
+            self.acked = max(self.acked, ack)
+            for tick, action in enumerate(packet[INPUT_HEADER.size:INPUT_HEADER.size + count], first):
+                if tick in remote_inputs or tick <= self.confirmed:
+                    continue
+                remote_inputs[tick] = action
+                guess = self.guesses.pop(tick, None)
+                if guess is not None and guess != action and (mispredicted is None or tick < mispredicted):
+                    mispredicted = tick
+
+        if mispredicted is not None:
+            # Go back to the first wrong guess and run every tick since then again with what is known now
+            for engine, state in zip(self.engines, self.snapshots[mispredicted]):
+                engine.restore(state)
+            for tick in range(mispredicted, self.tick):
+                self.guesses.pop(tick, None)
+                self.simulate(tick)
+            self.rolled_back = self.tick - mispredicted
+
+        while self.confirmed + 1 in remote_inputs:
+            self.confirmed += 1
+
+    def send(self):
+        # Every local input the other side hasn't acknowledged yet, so lost packets don't need resending
+        local_inputs = self.inputs[self.local]
+        first = self.acked + 1
+        last = min(self.latest, first + MAX_PACKET_INPUTS - 1)
+        actions = bytes(local_inputs[tick] for tick in range(first, last + 1))
+        self.channel.send(INPUT_HEADER.pack(b"I", self.confirmed, first, len(actions)) + actions)
+
+    def finished(self):
+        # The match is over once an engine has ended on ticks both inputs are known for
+        return self.tick - 1 <= self.confirmed and any(engine.game_over for engine in self.engines)
@@ -0,0 +1,17 @@
+# Free lists for the small objects the game keeps making and dropping (blocks of the falling sets), so
+# play reuses them instead of allocating. Objects come back through reset(*args) instead of __init__
+class Pool:
+    def __init__(self, factory):
+        self.factory = factory
+        self.free = []
+
+    def acquire(self, *args):
+        if self.free:
+            item = self.free.pop()
+            item.reset(*args)
+            return item
+        return self.factory(*args)
+
+    def release(self, items):
+        # Give back a list of objects, nothing may use them afterwards
+        self.free.extend(items)
@@ -0,0 +1,184 @@
+# Per-phase frame profiler for the game loop. The loop calls begin_frame, then mark(phase) at the end of
+# each phase (the time since the previous mark is charged to it, a phase can be marked more than once per
+# frame), then end_frame. When profiling is off the loop skips all of this behind a single flag check.
+# The overlay shows FPS, p50/p99 frame times, the average time of each phase as bars, the objects frames
+# left behind for the garbage collector, the garbage collections and the input latency of every player
+# (controls.InputManager.latency) when the game hands it over. dump writes every recorded frame to a CSV
+# or Chrome trace (chrome://tracing, Perfetto) file
+import collections
+import csv
+import gc
+import json
+import time
+
+import pygame
+
+# Phases of a frame in Game.run, in the order they run
+PHASES = ("wait", "events", "input", "update", "draw", "display")
+
+# Colors of the phase bars
+PHASE_COLORS = {
+    "wait": (90, 90, 90),
+    "events": (0, 160, 255),
+    "input": (255, 200, 0),
+    "update": (0, 200, 80),
+    "draw": (255, 80, 80),
+    "display": (200, 80, 255),
+}
+
+# Frames the overlay statistics are computed over, and how often (in frames) the overlay text is rendered again
+HISTORY, OVERLAY_INTERVAL = 240, 15
+
+# Overlay position and size, and the frame time (ms) a full-width bar stands for
+OVERLAY_RECT = pygame.Rect(10, 10, 300, 190)
+BAR_SCALE_MS = 1000.0 / 60
+
+
+class FrameProfiler:
+    def __init__(self, record=False):
+        self.enabled = False
+        self.overlay = False
+        # Keep every frame for dump, otherwise only the last HISTORY frames for the overlay
+        self.record = record
+        self.frames = []
+        self.history = collections.deque(maxlen=HISTORY)
+        self.spans = []  # (phase, start, end) of the current frame
+        self.frame_start = self.last = 0.0
+        # Garbage collections so far and when the frame began, the objects the frame has left behind so far
+        # and the collector's count at the end of the last mark, None while the profiler itself is busy
+        self.collections = 0
+        self.frame_collections = 0
+        self.objects = 0
+        self.last_count = None
+        gc.callbacks.append(self.count_collection)
+        self.frame_count = 0
+        self.font = None
+        self.overlay_surface = None
+        # Seconds from a press to the tick that used it, one per player, kept up to date by the game
+        self.input_latency = []
+
+    def toggle(self):
+        # Profiling and the overlay go on and off together
+        self.enabled = self.overlay = not self.enabled
+
+    def count_collection(self, phase, info):
+        if phase == "start":
+            self.collections += 1
+            # A collection resets the count, keep what the game had added to it
+            if self.last_count is not None:
+                self.objects += gc.get_count()[0] - self.last_count
+                self.last_count = 0
+
+    def begin_frame(self):
+        self.frame_start = self.last = time.perf_counter()
+        self.spans = []
+        self.frame_collections = self.collections
+        self.objects = 0
+        self.last_count = self.gc_count()
+
+    def gc_count(self):
+        # The collector's first generation count. get_count returns a new tuple, made after the count is
+        # read, and freed tuples are kept for reuse without counting down. Asking twice makes the second
+        # one reuse the first one's tuple, so reading the count doesn't move it
+        gc.get_count()
+        return gc.get_count()[0]
+
+    def mark(self, phase):
+        # Objects the game left behind since the last mark: the garbage collector's first generation count
+        # goes up for every list, tuple, dict or instance made and down for every one freed, and once it
+        # passes the threshold a collection runs. A game that keeps reusing its objects keeps it at zero.
+        # It is read around the profiler's own bookkeeping so that is left out
+        self.objects += self.gc_count() - self.last_count
+        self.last_count = None
+        now = time.perf_counter()
+        self.spans.append((phase, self.last, now))
+        self.last = now
+        self.last_count = self.gc_count()
+
+    def end_frame(self):
+        self.last_count = None
+        # (start, end, spans, objects left behind, garbage collections)
+        frame = (self.frame_start, self.last, self.spans, self.objects, self.collections - self.frame_collections)
+        self.history.append(frame)
+        if self.record:
+            self.frames.append(frame)
+        self.frame_count += 1
+
+    def phase_times(self, frame):
+        # Seconds spent in each phase of a frame
+        times = dict.fromkeys(PHASES, 0.0)
+        for phase, start, end in frame[2]:
+            times[phase] = times.get(phase, 0.0) + end - start
+        return times
+
+    def stats(self):
+        # FPS, p50 and p99 frame time in ms, the average ms of every phase, the average and most objects a
+        # frame left behind and the number of garbage collections, all over the history
+        frames = self.history
+        if len(frames) < 2:
+            return 0.0, 0.0, 0.0, dict.fromkeys(PHASES, 0.0), 0.0, 0, 0
+        durations = sorted(frame[1] - frame[0] for frame in frames)
+        elapsed = frames[-1][1] - frames[0][0]
+        fps = (len(frames) - 1) / elapsed if elapsed > 0 else 0.0
+        totals = dict.fromkeys(PHASES, 0.0)
+        for frame in frames:
+            for phase, seconds in self.phase_times(frame).items():
+                totals[phase] = totals.get(phase, 0.0) + seconds
+        averages = {phase: total * 1000.0 / len(frames) for phase, total in totals.items()}
+        return (fps, durations[len(durations) // 2] * 1000.0, durations[int(len(durations) * 0.99)] * 1000.0, averages,
+                sum(frame[3] for frame in frames) / len(frames), max(frame[3] for frame in frames), sum(frame[4] for frame in frames))
+
+    def draw(self, screen):
+        # Blit the overlay, re-rendered every OVERLAY_INTERVAL frames. Returns the rect to update
+        if self.overlay_surface is None or self.frame_count % OVERLAY_INTERVAL == 0:
+            self.overlay_surface = self.render()
+        screen.blit(self.overlay_surface, OVERLAY_RECT)
+        return OVERLAY_RECT
+
+    def render(self):
+        if self.font is None:
+            self.font = pygame.font.SysFont("Consolas", 14)
+        surface = pygame.Surface(OVERLAY_RECT.size)
+        surface.fill((0, 0, 0))
+        fps, p50, p99, averages, objects, most_objects, collections = self.stats()
+        surface.blit(self.font.render("{:.0f} fps  p50 {:.2f} ms  p99 {:.2f} ms".format(fps, p50, p99), True, (255, 255, 255)), (6, 4))
+        bar_width = OVERLAY_RECT.width - 130
+        for index, phase in enumerate(PHASES):
+            y = 24 + index * 20
+            surface.blit(self.font.render("{:<8}{:6.2f}".format(phase, averages[phase]), True, (255, 255, 255)), (6, y))
+            width = min(int(averages[phase] / BAR_SCALE_MS * bar_width), bar_width)
+            pygame.draw.rect(surface, PHASE_COLORS[phase], (124, y + 2, max(width, 1), 12))
+        surface.blit(self.font.render("objects/frame {:+.1f} max {}  gc {}".format(objects, most_objects, collections), True, (255, 255, 255)),
+                     (6, 24 + len(PHASES) * 20))
+        if self.input_latency:
+            latency = " ".join("{:.1f}".format(seconds * 1000.0) for seconds in self.input_latency)
+            surface.blit(self.font.render("input ms {}".format(latency), True, (255, 255, 255)), (6, 44 + len(PHASES) * 20))
+        return surface
+
+    def dump(self, path):
+        # .json writes a Chrome trace with one event per phase span, anything else a CSV with one row per frame
+        frames = self.frames if self.record else list(self.history)
+        if not frames:
+            return
+        origin = frames[0][0]
+        if path.endswith(".json"):
+            events = []
+            for number, (start, end, spans, objects, collections) in enumerate(frames):
+                events.append({"name": "frame {}".format(number), "ph": "X", "pid": 0, "tid": 0,
+                               "ts": (start - origin) * 1e6, "dur": (end - start) * 1e6})
+                events.append({"name": "memory", "ph": "C", "pid": 0, "ts": (start - origin) * 1e6,
+                               "args": {"objects": objects, "gc": collections}})
+                for phase, span_start, span_end in spans:
+                    events.append({"name": phase, "ph": "X", "pid": 0, "tid": 0,
+                                   "ts": (span_start - origin) * 1e6, "dur": (span_end - span_start) * 1e6})
+            with open(path, "w") as f:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        else:
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["frame", "start_ms", "frame_ms"] + ["{}_ms".format(phase) for phase in PHASES] +
+                                ["objects", "collections"])
+                for number, frame in enumerate(frames):
+                    times = self.phase_times(frame)
+                    writer.writerow([number, round((frame[0] - origin) * 1000.0, 3), round((frame[1] - frame[0]) * 1000.0, 3)] +
+                                    [round(times[phase] * 1000.0, 3) for phase in PHASES] + [frame[3], frame[4]])
@@ -0,0 +1,53 @@
+import random
+from collections import deque
+
+# Default number of blocks in the bag, split evenly between the block types
+BAG_SIZE = 100
+
+# Number of blocks in each set
+SET_SIZE = 3
+
+
+# Bag randomizer: every block type appears in the bag as often as its count says, blocks are handed out
+# in shuffled order and the bag refills itself once it is empty. The shuffle is done one draw at a time
+# (Fisher-Yates), so each draw costs the same no matter how big the bag is and a refill is just
+# rewinding the index. Two randomizers with the same seed hand out the same sequence
+class BagRandomizer:
+    def __init__(self, types, counts=None, seed=None, preview=1, set_size=SET_SIZE):
+        if counts is None:
+            counts = [BAG_SIZE // len(types)] * len(types)
+        self.bag = [block_type for block_type, count in zip(types, counts) for _ in range(count)]
+        if not self.bag:
+            raise ValueError("the bag is empty")
+        self.rng = random.Random(seed)
+        self.index = 0
+        self.set_size = set_size
+        # Upcoming sets, the first one is handed out by the next call to next_set
+        self.queue = deque(self.draw_set() for _ in range(max(preview, 1)))
+
+    def draw(self):
+        bag, index = self.bag, self.index
+        pick = self.rng.randrange(index, len(bag))
+        bag[index], bag[pick] = bag[pick], bag[index]
+        self.index = index + 1 if index + 1 < len(bag) else 0
+        return bag[index]
+
+    def draw_set(self):
+        return [self.draw() for _ in range(self.set_size)]
+
+    def next_set(self):
+        self.queue.append(self.draw_set())
+        return self.queue.popleft()
+
+    def preview(self):
+        return list(self.queue)
+
+    def snapshot(self):
+        # The sets in the queue are never changed in place, so sharing them is safe
+        return self.rng.getstate(), self.bag[:], self.index, tuple(self.queue)
+
+    def restore(self, state):
+        rng_state, bag, self.index, queue = state
+        self.rng.setstate(rng_state)
+        self.bag[:] = bag
+        self.queue = deque(queue)
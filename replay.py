@@ -0,0 +1,196 @@
+# Input-log replays: a match is fully determined by its seed, its settings and the action bitmask every
+# player sent on every tick, so that is all a replay stores. The actions of all players for one tick are
+# packed into one int (4 bits per player) and runs of identical ticks are stored once with their length,
+# both as varints, and the whole stream is deflated. Most ticks have no input at all, so a 10 minute match
+# takes a few kilobytes.
+#
+#   python replay.py replays/match.rpl        re-simulate headless as fast as possible and check the result
+import struct
+import sys
+import time
+import zlib
+
+from engine import Engine
+
+MAGIC = b"RPLY"
+# 2: rotations kick off walls and the floor (shapes.KICKS), version 1 replays play out differently
+VERSION = 2
+
+# magic, version, seed, tick rate, gravity, grid width, grid height, players, preview length, ticks, checksum
+HEADER = struct.Struct("<4sBQHHBBBBII")
+
+# Bits of one player's action bitmask in the packed tick
+ACTION_BITS = 4
+
+
+def write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def pack(actions):
+    packed = 0
+    for index, action in enumerate(actions):
+        packed |= action << (index * ACTION_BITS)
+    return packed
+
+
+def unpack(packed, players):
+    mask = (1 << ACTION_BITS) - 1
+    return tuple((packed >> (index * ACTION_BITS)) & mask for index in range(players))
+
+
+def checksum(engines):
+    # CRC of every board and counter that matters, two runs that end with the same checksum played the same game
+    crc = 0
+    for engine in engines:
+        crc = zlib.crc32(engine.board.types, crc)
+        crc = zlib.crc32(struct.pack("<IIII?", engine.ticks, engine.pieces, engine.cleared_total, engine.fall_counter,
+                                     engine.game_over), crc)
+    return crc
+
+
+# Settings a match has to be replayed with, recorded in the header
+class Replay:
+    def __init__(self, seed, tick_rate, gravity, width, height, players, preview, ticks=0, checksum=0, body=b""):
+        self.seed = seed
+        self.tick_rate = tick_rate
+        self.gravity = gravity
+        self.width = width
+        self.height = height
+        self.players = players
+        self.preview = preview
+        self.ticks = ticks
+        self.checksum = checksum
+        # Varint (packed actions, run length) pairs
+        self.body = body
+
+    def engines(self):
+        # Fresh engines set up like the ones that were recorded
+        return [Engine(self.width, self.height, self.seed, self.gravity, preview=self.preview) for _ in range(self.players)]
+
+    def actions(self):
+        # Yield a tuple with every player's action bitmask, one per tick
+        data, pos, players = self.body, 0, self.players
+        while pos < len(data):
+            packed, pos = read_varint(data, pos)
+            run, pos = read_varint(data, pos)
+            actions = unpack(packed, players)
+            for _ in range(run):
+                yield actions
+
+    def to_bytes(self):
+        return HEADER.pack(MAGIC, VERSION, self.seed, self.tick_rate, self.gravity, self.width, self.height, self.players,
+                           self.preview, self.ticks, self.checksum) + zlib.compress(bytes(self.body), 9)
+
+    @classmethod
+    def from_bytes(cls, data):
+        # Anything that isn't a whole replay of this version raises ValueError
+        try:
+            magic, version, *fields = HEADER.unpack_from(data)
+        except struct.error:
+            raise ValueError("too short for a replay header") from None
+        if magic != MAGIC:
+            raise ValueError("not a replay file")
+        if version != VERSION:
+            raise ValueError("replay version {}, this game plays version {}".format(version, VERSION))
+        try:
+            body = zlib.decompress(data[HEADER.size:])
+        except zlib.error as error:
+            raise ValueError("damaged replay body ({})".format(error)) from None
+        return cls(*fields, body=body)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+# Records a match tick by tick, call record once per tick with every player's actions before the
+# engines step, then finish with the engines to store the final checksum
+class ReplayRecorder:
+    def __init__(self, seed, tick_rate, gravity, width, height, players, preview):
+        self.replay = Replay(seed, tick_rate, gravity, width, height, players, preview, body=bytearray())
+        self.packed = None
+        self.run = 0
+
+    def record(self, actions):
+        packed = pack(actions)
+        if packed == self.packed:
+            self.run += 1
+            return
+        self.flush()
+        self.packed = packed
+        self.run = 1
+
+    def flush(self):
+        if self.run:
+            write_varint(self.replay.body, self.packed)
+            write_varint(self.replay.body, self.run)
+            self.replay.ticks += self.run
+            self.run = 0
+
+    def finish(self, engines):
+        self.flush()
+        self.packed = None
+        self.replay.checksum = checksum(engines)
+        return self.replay
+
+
+# Re-drive the engines with the recorded actions as fast as possible, no rendering. Returns the engines
+def simulate(replay):
+    engines = replay.engines()
+    for actions in replay.actions():
+        for engine, action in zip(engines, actions):
+            engine.step(action)
+    return engines
+
+
+def verify(replay):
+    # True when re-simulating ends in exactly the recorded state
+    return checksum(simulate(replay)) == replay.checksum
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print("usage: python replay.py REPLAY...")
+        return 2
+    status = 0
+    for path in argv:
+        try:
+            replay = Replay.load(path)
+        except (OSError, ValueError) as error:
+            print("{}: unreadable or unsupported, {}".format(path, error))
+            status = 1
+            continue
+        start = time.perf_counter()
+        ok = verify(replay)
+        elapsed = time.perf_counter() - start
+        print("{}: {} ticks ({:.1f} s of play) seed={}, re-simulated in {:.3f} s, {}".format(
+            path, replay.ticks, replay.ticks / replay.tick_rate, replay.seed, elapsed,
+            "ok" if ok else "MISMATCH"))
+        if not ok:
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+# Falling set shapes. A set is a shape id, the (row, col) of its origin cell and a rotation index, and its
+# cells come straight from a table. Every rotation state of every shape and the wall kicks to try when a
+# rotation doesn't fit in place are worked out once when the module is loaded, so a rotation is a table
+# lookup and one bitmask fit test (more only when it has to kick), and it either happens whole or not at all
+from board import cells_to_masks
+
+CLOCKWISE, COUNTERCLOCKWISE = 1, -1
+
+# Cells of each shape in its spawn rotation, as (row, col) offsets from the origin. The origin is the
+# cell rotations turn around and always comes second, so cells[1] is the origin in every rotation
+SHAPES = {
+    "L": ((0, -1), (0, 0), (1, 0)),  # the three block sets of engine.Engine
+    "T": ((1, 0), (0, 0), (0, -1), (0, 1)),  # the four block sets of the legacy game.py
+}
+
+# (row, col) moves tried in order when a rotated set doesn't fit: in place, one column left, one column
+# right (off a wall or a stack) and one row up (off the floor)
+KICKS = ((0, 0), (0, -1), (0, 1), (-1, 0))
+
+
+def turn(offsets):
+    # A quarter turn clockwise around the origin
+    return tuple((col, -row) for row, col in offsets)
+
+
+def build_rotations(offsets):
+    rotations = [tuple(offsets)]
+    for _ in range(3):
+        rotations.append(turn(rotations[-1]))
+    return tuple(rotations)
+
+
+def build_masks(rotations):
+    # Each rotation as (top row, left column) of its bounding box relative to the origin and the row
+    # bitmasks of Board.fits_masks, so a fit test is one shift and one AND per row
+    return tuple(cells_to_masks(offsets) for offsets in rotations)
+
+
+def build_turns(rotations, masks):
+    # For each rotation and direction: (rotation it turns into, ((kick, top, left, row masks), ...)) with
+    # the kick already added to the bounding box corner
+    turns = []
+    for rotation in range(len(rotations)):
+        by_direction = {}
+        for direction in (CLOCKWISE, COUNTERCLOCKWISE):
+            target = (rotation + direction) % len(rotations)
+            top, left, row_masks = masks[target]
+            tests = tuple(((kick_row, kick_col), top + kick_row, left + kick_col, row_masks) for kick_row, kick_col in KICKS)
+            by_direction[direction] = (target, tests)
+        turns.append(by_direction)
+    return tuple(turns)
+
+
+# ROTATIONS[shape][rotation] is the cell offsets of that rotation, MASKS[shape][rotation] what build_masks
+# describes and TURNS[shape][rotation][direction] what build_turns describes
+ROTATIONS = {shape: build_rotations(offsets) for shape, offsets in SHAPES.items()}
+MASKS = {shape: build_masks(rotations) for shape, rotations in ROTATIONS.items()}
+TURNS = {shape: build_turns(rotations, MASKS[shape]) for shape, rotations in ROTATIONS.items()}
+
+
+def cells(shape, origin, rotation=0):
+    row, col = origin
+    return [(row + d_row, col + d_col) for d_row, d_col in ROTATIONS[shape][rotation]]
+
+
+def fits(board, shape, origin, rotation=0):
+    top, left, masks = MASKS[shape][rotation]
+    return board.fits_masks(origin[0] + top, origin[1] + left, masks)
+
+
+def rotate(board, shape, origin, rotation, direction=CLOCKWISE):
+    # The first kick of the turn that fits on the board as (origin, rotation, cells), None when none does
+    target, tests = TURNS[shape][rotation][direction]
+    row, col = origin
+    for (kick_row, kick_col), top, left, masks in tests:
+        if board.fits_masks(row + top, col + left, masks):
+            origin = (row + kick_row, col + kick_col)
+            return origin, target, cells(shape, origin, target)
+    return None
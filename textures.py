@@ -0,0 +1,78 @@
+import pygame
+
+from assets import assets
+from atlas import tiles
+
+# Define some colors
+RED = (255, 0, 0)
+
+# Opacity of the ghost preview that shows where the falling set will land
+GHOST_ALPHA = 80
+
+# Name of the texture for each block type, a tile of the atlas (see atlas.TILE_NAMES) or an assets.MANIFEST image
+BLOCK_TEXTURES = {
+    1: "wood",
+    2: "rock",
+    3: "diamond",
+    4: "bomb",
+    5: "missile",
+}
+
+
+# Shared registry of block textures, every (block_type, block_size) pair is loaded, converted and scaled exactly once.
+# Textures on the sprite sheet are subsurfaces of the one scaled atlas surface
+class TextureCache:
+    def __init__(self):
+        self.textures = {}
+
+    def get(self, block_type, block_size):
+        key = (block_type, block_size)
+        texture = self.textures.get(key)
+        if texture is None:
+            texture = self.load(block_type, block_size)
+            self.textures[key] = texture
+        return texture
+
+    def ghost(self, block_type, block_size):
+        # Faded copy of a block texture for the landing preview
+        key = (block_type, block_size, "ghost")
+        texture = self.textures.get(key)
+        if texture is None:
+            texture = self.get(block_type, block_size)
+            # A subsurface of the atlas has its own alpha, fade that instead of copying the pixels
+            texture = texture.subsurface(texture.get_rect()) if texture.get_parent() else texture.copy()
+            texture.set_alpha(GHOST_ALPHA)
+            self.textures[key] = texture
+        return texture
+
+    def load(self, block_type, block_size):
+        name = BLOCK_TEXTURES[block_type]
+        if name in tiles:
+            return tiles.get(name, block_size)
+        try:
+            return assets.get(name, (block_size, block_size))
+        except FileNotFoundError:
+            # Some textures (missile.png) are not drawn yet, use a plain placeholder so the game keeps running
+            texture = pygame.Surface((block_size, block_size)).convert()
+            texture.fill(RED)
+            return texture
+
+    def preload_async(self, block_size):
+        # Start decoding the block textures in the background, e.g. while the splash screen is up
+        assets.preload(tiles.requests(block_size) +
+                       [(name, (block_size, block_size)) for name in BLOCK_TEXTURES.values() if name not in tiles])
+
+    def preload(self, block_size):
+        # Load every block texture up front so the first frames don't stall on disk access
+        for block_type in BLOCK_TEXTURES:
+            self.get(block_type, block_size)
+            self.ghost(block_type, block_size)
+
+    def clear(self):
+        # Drop all cached textures, needed when the display mode (and pixel format) changes
+        self.textures.clear()
+        tiles.clear()
+        assets.clear()
+
+
+textures = TextureCache()
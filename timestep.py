@@ -0,0 +1,27 @@
+# Fixed-timestep accumulator: the game logic runs at a constant tick rate no matter how fast frames
+# are rendered. Each frame reports the time that passed, gets back how many ticks to simulate, and
+# can use alpha (how far we are into the next tick, 0..1) to interpolate what it draws
+class FixedTimestep:
+    def __init__(self, tick_rate=60, max_ticks=5):
+        self.tick_rate = tick_rate
+        self.dt = 1.0 / tick_rate
+        # After a long stall (window drag, breakpoint) don't try to catch up more than this in one frame
+        self.max_ticks = max_ticks
+        self.accumulator = 0.0
+        self.ticks = 0
+
+    def advance(self, elapsed):
+        # elapsed is in seconds, returns the number of ticks to run this frame
+        self.accumulator += elapsed
+        ticks = int(self.accumulator / self.dt)
+        if ticks > self.max_ticks:
+            ticks = self.max_ticks
+            self.accumulator = 0.0
+        else:
+            self.accumulator -= ticks * self.dt
+        self.ticks += ticks
+        return ticks
+
+    @property
+    def alpha(self):
+        return min(self.accumulator / self.dt, 1.0)